@@ -0,0 +1,51 @@
+"""
+Per-request authentication overhead of get_current_user, with and without the verified-token cache.
+
+    python benchmarks/auth_overhead.py [iterations]
+
+Runs in-process (no server): the principal is pre-cached, so only token handling is measured.
+"""
+import asyncio
+import os
+import sys
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "backend"))
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+
+from auth import utils  # noqa: E402
+from auth.schemas import User  # noqa: E402
+from cache import TTLCache  # noqa: E402
+
+
+def bench(label: str, iterations: int, token: str) -> float:
+    async def run():
+        started = time.perf_counter()
+        for _ in range(iterations):
+            await utils.get_current_user(token)
+        return time.perf_counter() - started
+
+    elapsed = asyncio.run(run())
+    per_call_us = elapsed / iterations * 1e6
+    print(f"{label:<28} {per_call_us:8.1f} us/request")
+    return per_call_us
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    token = utils.create_access_token(
+        {"sub": "clerk", "role": "clerk"}, expires_delta=timedelta(minutes=utils.ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    utils.cache_principal(User(username="clerk", role="clerk"))
+
+    enabled = utils.token_cache
+    utils.token_cache = TTLCache(0, 0)  # Every lookup misses: jwt.decode on each request
+    before = bench("jwt.decode every request", iterations, token)
+    utils.token_cache = enabled
+    after = bench("verified-token cache", iterations, token)
+    print(f"{'speedup':<28} {before / after:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
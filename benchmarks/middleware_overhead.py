@@ -0,0 +1,111 @@
+"""
+Requests/second through ObservabilityMiddleware, against the BaseHTTPMiddleware version it replaced.
+
+    python benchmarks/middleware_overhead.py [requests]
+
+Runs in-process (no server): requests are ASGI calls to a one-route Starlette app, so only
+the middleware's own overhead differs between the rows.
+"""
+import asyncio
+import logging
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "backend"))
+
+from starlette.applications import Starlette  # noqa: E402
+from starlette.middleware.base import BaseHTTPMiddleware  # noqa: E402
+from starlette.responses import JSONResponse  # noqa: E402
+from starlette.routing import Route  # noqa: E402
+
+from logging_config import request_id_ctx, process_id_ctx  # noqa: E402
+from middleware import ObservabilityMiddleware  # noqa: E402
+
+
+class BaseHTTPObservabilityMiddleware(BaseHTTPMiddleware):
+    """The previous implementation, kept here as the baseline."""
+
+    async def dispatch(self, request, call_next):
+        req_id = request.headers.get("X-Request-Id") or str(uuid.uuid4())
+        proc_id = request.headers.get("X-Process-Id") or "N/A"
+        req_token = request_id_ctx.set(req_id)
+        proc_token = process_id_ctx.set(proc_id)
+        try:
+            response = await call_next(request)
+            logging.getLogger("middleware").info(
+                f"{request.method} {request.url.path} - HTTP/1.1 {response.status_code}"
+            )
+            response.headers["X-Request-Id"] = req_id
+            if proc_id != "N/A":
+                response.headers["X-Process-Id"] = proc_id
+            return response
+        finally:
+            request_id_ctx.reset(req_token)
+            process_id_ctx.reset(proc_token)
+
+
+async def ping(request):
+    return JSONResponse({"status": "ok"})
+
+
+def make_app(middleware_class=None):
+    app = Starlette(routes=[Route("/accounts/ping", ping), Route("/health", ping)])
+    return middleware_class(app) if middleware_class else app
+
+
+def bench(label: str, app, path: str, requests: int) -> float:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "headers": [(b"host", b"bench"), (b"x-process-id", b"bench")],
+        "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 80),
+    }
+
+    async def request():
+        # Like a server: the body once, then http.disconnect once the response is complete
+        received = False
+        complete = asyncio.Event()
+
+        async def receive():
+            nonlocal received
+            if not received:
+                received = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await complete.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                complete.set()
+
+        await app(dict(scope), receive, send)
+
+    async def run():
+        for _ in range(requests // 10):  # Warm-up
+            await request()
+        started = time.perf_counter()
+        for _ in range(requests):
+            await request()
+        return time.perf_counter() - started
+
+    elapsed = asyncio.run(run())
+    rate = requests / elapsed
+    print(f"{label:<34} {rate:10.0f} req/s  {elapsed / requests * 1e6:7.1f} us/request")
+    return rate
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    logging.basicConfig(level=logging.INFO, handlers=[logging.NullHandler()])  # Records built, not written
+
+    bench("no middleware", make_app(), "/accounts/ping", requests)
+    before = bench("BaseHTTPMiddleware (before)", make_app(BaseHTTPObservabilityMiddleware), "/accounts/ping", requests)
+    after = bench("pure ASGI (after)", make_app(ObservabilityMiddleware), "/accounts/ping", requests)
+    bench("pure ASGI, quiet /health", make_app(ObservabilityMiddleware), "/health", requests)
+    print(f"\nSpeed-up: {after / before:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
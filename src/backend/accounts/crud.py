@@ -1,41 +1,34 @@
-import random
+import base64
+import json
+import sqlite3
 from datetime import date
-from typing import Optional, Dict, List
-from database import get_connection
-from accounts.schemas import AccountCreate, AccountUpdate
+from typing import Optional, Dict, List, Tuple, Any, Iterator
+import timing
+from database import ACCOUNT_COLUMNS
+from accounts.schemas import AccountCreate, AccountUpdate, AccountSortField, SortOrder
 
-def generate_account_id() -> str:
-    conn = get_connection()
-    cursor = conn.cursor()
-    while True:
-        account_id = str(random.randint(1000000, 9999999))
-        cursor.execute("SELECT account_id FROM accounts WHERE account_id=?", (account_id,))
-        if cursor.fetchone() is None:
-            conn.close()
-            return account_id
-
-def create_account(account: AccountCreate) -> Dict:
-    conn = get_connection()
+INSERT_ACCOUNT_SQL = """
+    INSERT INTO accounts (
+    account_id, account_holder_name, dob, gender, email, phone, 
+    address, zip_code, account_type, balance, date_opened, 
+    status, services, marketing_opt_in, agreed_to_terms
+    ) 
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+def _account_values(account_id: str, account: AccountCreate, date_opened: str) -> tuple:
+    return (account_id, account.account_holder_name, account.dob, account.gender,
+            account.email, account.phone, account.address, account.zip_code,
+            account.account_type, account.balance, date_opened, account.status,
+            account.services, account.marketing_opt_in, account.agreed_to_terms)
+
+def create_account(conn: sqlite3.Connection, account: AccountCreate, account_id: str) -> Dict:
+    """`account_id` comes from accounts.id_allocator."""
     cursor = conn.cursor()
-    account_id = generate_account_id()
     date_opened = date.today().isoformat()
 
-    cursor.execute(
-        """
-            INSERT INTO accounts (
-            account_id, account_holder_name, dob, gender, email, phone, 
-            address, zip_code, account_type, balance, date_opened, 
-            status, services, marketing_opt_in, agreed_to_terms
-            ) 
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-        (account_id, account.account_holder_name, account.dob, account.gender,
-         account.email, account.phone, account.address, account.zip_code,
-         account.account_type, account.balance, date_opened, account.status,
-         account.services, account.marketing_opt_in, account.agreed_to_terms)
-    )
-    conn.commit()
-    conn.close()
+    with timing.phase("insert"):
+        cursor.execute(INSERT_ACCOUNT_SQL, _account_values(account_id, account, date_opened))
 
     return {
         "account_id": account_id,
@@ -43,24 +36,146 @@ def create_account(account: AccountCreate) -> Dict:
         "message": "Account created successfully"
     }
 
-def get_all_accounts() -> List[Dict]:
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM accounts")
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+def create_accounts(conn: sqlite3.Connection, accounts: List[AccountCreate], account_ids: List[str]) -> List[Dict]:
+    """
+    Inserts many accounts with one executemany on the caller's transaction.
+    `account_ids` (from accounts.id_allocator) pair up with `accounts`; results keep input order.
+    """
+    if not accounts:
+        return []
+
+    date_opened = date.today().isoformat()
+
+    with timing.phase("insert"):
+        conn.executemany(
+            INSERT_ACCOUNT_SQL,
+            [_account_values(account_id, account, date_opened) for account_id, account in zip(account_ids, accounts)]
+        )
+
+    return [
+        {
+            "account_id": account_id,
+            "date_opened": date_opened,
+            "message": "Account created successfully"
+        }
+        for account_id in account_ids
+    ]
 
-def get_account_by_id(account_id: str) -> Optional[Dict]:
-    conn = get_connection()
+def encode_cursor(sort_value: Any, account_id: str) -> str:
+    raw = json.dumps([sort_value, account_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[Any, str]:
+    """Raises ValueError if the cursor was not produced by encode_cursor()."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_value, account_id = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(account_id, str) or not isinstance(sort_value, (str, int, float, type(None))):
+        raise ValueError("Invalid cursor")
+    return sort_value, account_id
+
+def build_account_filters(
+        status: Optional[str] = None,
+        account_type: Optional[str] = None,
+        zip_code: Optional[str] = None,
+        date_opened_from: Optional[date] = None,
+        date_opened_to: Optional[date] = None
+) -> Tuple[List[str], List[Any]]:
+    """Returns WHERE clauses and their parameters; every clause is served by an index from init_db."""
+    clauses, params = [], []
+    if status is not None:
+        clauses.append("status = ?")
+        params.append(status)
+    if account_type is not None:
+        clauses.append("account_type = ?")
+        params.append(account_type)
+    if zip_code is not None:
+        clauses.append("zip_code = ?")
+        params.append(zip_code)
+    if date_opened_from is not None:
+        clauses.append("date_opened >= ?")
+        params.append(date_opened_from.isoformat())
+    if date_opened_to is not None:
+        clauses.append("date_opened <= ?")
+        params.append(date_opened_to.isoformat())
+    return clauses, params
+
+def get_accounts_page(
+        conn: sqlite3.Connection,
+        limit: int,
+        cursor: Optional[str] = None,
+        sort_by: AccountSortField = AccountSortField.account_id,
+        order: SortOrder = SortOrder.asc,
+        **filters
+) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Keyset pagination: seeks past the (sort value, account_id) of the previous page
+    instead of using OFFSET, so every page costs the same however deep it is.
+    """
+    clauses, params = build_account_filters(**filters)
+    column = sort_by.value
+    direction = "DESC" if order == SortOrder.desc else "ASC"
+    comparison = "<" if order == SortOrder.desc else ">"
+
+    if cursor is not None:
+        last_value, last_id = decode_cursor(cursor)
+        if sort_by == AccountSortField.account_id:
+            clauses.append(f"account_id {comparison} ?")
+            params.append(last_id)
+        else:
+            clauses.append(f"({column}, account_id) {comparison} (?, ?)")
+            params.extend([last_value, last_id])
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    order_by = f"ORDER BY {column} {direction}"
+    if sort_by != AccountSortField.account_id:
+        order_by += f", account_id {direction}"
+
+    db_cursor = conn.cursor()
+    # Fetch one extra row to find out whether another page exists
+    db_cursor.execute(f"SELECT * FROM accounts {where} {order_by} LIMIT ?", (*params, limit + 1))
+    rows = [dict(row) for row in db_cursor.fetchall()]
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last[column], last["account_id"])
+    return rows, next_cursor
+
+def iter_account_batches(conn: sqlite3.Connection, batch_size: int, **filters) -> Iterator[List[tuple]]:
+    """
+    Streams accounts as plain tuples in ACCOUNT_COLUMNS order, `batch_size` rows at a time,
+    walking the primary key so memory stays flat regardless of table size.
+    """
+    clauses, params = build_account_filters(**filters)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    db_cursor = conn.cursor()
+    db_cursor.row_factory = None  # Tuples are all an export needs; skip sqlite3.Row
+    db_cursor.execute(
+        f"SELECT {', '.join(ACCOUNT_COLUMNS)} FROM accounts {where} ORDER BY account_id",
+        params
+    )
+    while True:
+        rows = db_cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield rows
+
+def get_account_by_id(conn: sqlite3.Connection, account_id: str) -> Optional[Dict]:
     cursor = conn.cursor()
     cursor.execute("SELECT * FROM accounts WHERE account_id=?", (account_id,))
     row = cursor.fetchone()
-    conn.close()
     return dict(row) if row else None
 
-def update_account(account_id: str, account: AccountUpdate) -> bool:
-    conn = get_connection()
+def get_account_version(conn: sqlite3.Connection, account_id: str) -> Optional[int]:
+    row = conn.execute("SELECT version FROM accounts WHERE account_id=?", (account_id,)).fetchone()
+    return row[0] if row else None
+
+def update_account(conn: sqlite3.Connection, account_id: str, account: AccountUpdate) -> bool:
     cursor = conn.cursor()
 
     cursor.execute(
@@ -68,7 +183,7 @@ def update_account(account_id: str, account: AccountUpdate) -> bool:
         UPDATE accounts SET 
         account_holder_name=?, dob=?, gender=?, email=?, phone=?, 
         address=?, zip_code=?, account_type=?, balance=?, status=?, 
-        services=?, marketing_opt_in=?
+        services=?, marketing_opt_in=?, version=version + 1
         WHERE account_id=?
         """,
         (account.account_holder_name, account.dob, account.gender,
@@ -76,16 +191,9 @@ def update_account(account_id: str, account: AccountUpdate) -> bool:
          account.account_type, account.balance, account.status,
          account.services, account.marketing_opt_in, account_id)
     )
-    conn.commit()
-    rows_affected = cursor.rowcount
-    conn.close()
-    return rows_affected > 0
+    return cursor.rowcount > 0
 
-def delete_account(account_id: str) -> bool:
-    conn = get_connection()
+def delete_account(conn: sqlite3.Connection, account_id: str) -> bool:
     cursor = conn.cursor()
     cursor.execute("DELETE FROM accounts WHERE account_id=?", (account_id,))
-    conn.commit()
-    rows_affected = cursor.rowcount
-    conn.close()
-    return rows_affected > 0
\ No newline at end of file
+    return cursor.rowcount > 0
\ No newline at end of file
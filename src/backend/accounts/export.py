@@ -0,0 +1,59 @@
+import csv
+import io
+import json
+import zlib
+from typing import Iterable, Iterator, List
+
+from database import ACCOUNT_COLUMNS
+
+BOOLEAN_COLUMNS = {"marketing_opt_in", "agreed_to_terms"}
+_BOOLEAN_INDEXES = [i for i, name in enumerate(ACCOUNT_COLUMNS) if name in BOOLEAN_COLUMNS]
+
+
+def _with_booleans(row: tuple) -> list:
+    # SQLite hands booleans back as 0/1
+    values = list(row)
+    for i in _BOOLEAN_INDEXES:
+        values[i] = bool(values[i])
+    return values
+
+
+def ndjson_chunks(batches: Iterable[List[tuple]]) -> Iterator[bytes]:
+    """One JSON object per line, with the same fields as AccountResponse."""
+    for batch in batches:
+        lines = [
+            json.dumps(dict(zip(ACCOUNT_COLUMNS, _with_booleans(row))), separators=(",", ":"))
+            for row in batch
+        ]
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def csv_chunks(batches: Iterable[List[tuple]]) -> Iterator[bytes]:
+    """CSV in init_db column order, booleans written as true/false like tests/api_pytest/data/accounts.csv."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+
+    writer.writerow(ACCOUNT_COLUMNS)
+    for batch in batches:
+        for row in batch:
+            values = list(row)
+            for i in _BOOLEAN_INDEXES:
+                values[i] = "true" if values[i] else "false"
+            writer.writerow(values)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+
+    # Header-only export when nothing matched
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Compresses a chunk stream incrementally (gzip container, wbits=31)."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
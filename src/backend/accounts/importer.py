@@ -0,0 +1,272 @@
+import csv
+import io
+import json
+import re
+import sqlite3
+from datetime import date
+from typing import Dict, Iterator, List, Optional, TextIO, Tuple
+
+from accounts import crud, id_allocator
+from accounts.schemas import FileFormat
+from database import begin_immediate
+
+IMPORT_CHUNK_SIZE = 5000
+MAX_REPORTED_REJECTS = 1000
+
+# Columns that must be present in the file header (same as the required AccountCreate fields)
+REQUIRED_COLUMNS = (
+    "account_holder_name", "dob", "gender", "email", "phone",
+    "address", "zip_code", "account_type", "marketing_opt_in",
+)
+# Optional columns and the value used when they are missing from the file
+OPTIONAL_COLUMNS = {
+    "balance": "0",
+    "status": "Active",
+    "services": "",
+    "agreed_to_terms": "false",
+    "date_opened": "",  # Legacy books may carry their own; defaults to today
+}
+
+TRUE_VALUES = {"true", "1", "yes", "y"}
+FALSE_VALUES = {"false", "0", "no", "n"}
+
+DATE_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}")
+EMAIL_PATTERN = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")
+PHONE_PATTERN = re.compile(r"\+?[0-9][0-9\-\s()]{5,19}")
+ZIP_CODE_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9\- ]{2,9}")
+
+
+class ImportFormatError(ValueError):
+    """The file cannot be imported at all (e.g. a required column is missing)."""
+
+
+# =========================================================
+# Column-wise validators
+# Each takes a whole column and returns one ok-flag per row, so a chunk is checked
+# with a handful of C-level map() passes instead of one Pydantic model per row.
+# =========================================================
+
+def _non_empty(values: List[str]) -> List[bool]:
+    return [bool(v) for v in map(str.strip, values)]
+
+
+def _matches(pattern: re.Pattern, values: List[str]) -> List[bool]:
+    return [m is not None for m in map(pattern.fullmatch, values)]
+
+
+def _is_iso_date(value: str) -> bool:
+    if DATE_PATTERN.fullmatch(value) is None:
+        return False
+    try:
+        date.fromisoformat(value)
+        return True
+    except ValueError:
+        return False
+
+
+def _dates(values: List[str]) -> List[bool]:
+    return list(map(_is_iso_date, values))
+
+
+def _optional_dates(values: List[str]) -> List[bool]:
+    return [not v or _is_iso_date(v) for v in values]
+
+
+def _booleans(values: List[str]) -> List[bool]:
+    known = TRUE_VALUES | FALSE_VALUES
+    return [v in known for v in map(str.lower, values)]
+
+
+def _is_balance(value: str) -> bool:
+    try:
+        return float(value) >= 0
+    except ValueError:
+        return False
+
+
+def _balances(values: List[str]) -> List[bool]:
+    return list(map(_is_balance, values))
+
+
+# column -> (validator, error message)
+COLUMN_RULES = {
+    "account_holder_name": (_non_empty, "required"),
+    "dob": (_dates, "expected YYYY-MM-DD"),
+    "gender": (_non_empty, "required"),
+    "email": (lambda values: _matches(EMAIL_PATTERN, values), "invalid email"),
+    "phone": (lambda values: _matches(PHONE_PATTERN, values), "invalid phone"),
+    "address": (_non_empty, "required"),
+    "zip_code": (lambda values: _matches(ZIP_CODE_PATTERN, values), "invalid zip code"),
+    "account_type": (_non_empty, "required"),
+    "balance": (_balances, "expected a non-negative number"),
+    "status": (_non_empty, "required"),
+    "marketing_opt_in": (_booleans, "expected true/false"),
+    "agreed_to_terms": (_booleans, "expected true/false"),
+    "date_opened": (_optional_dates, "expected YYYY-MM-DD"),
+}
+
+
+def validate_chunk(columns: Dict[str, List[str]]) -> Dict[int, Dict[str, str]]:
+    """
+    Validates a chunk column by column.
+    Returns {row offset: {column: error}} for the rejected rows only.
+    """
+    errors: Dict[int, Dict[str, str]] = {}
+    for column, (validator, message) in COLUMN_RULES.items():
+        for offset, ok in enumerate(validator(columns[column])):
+            if not ok:
+                errors.setdefault(offset, {})[column] = message
+    return errors
+
+
+# =========================================================
+# Readers: yield (line numbers, columns) chunks without loading the whole file
+# =========================================================
+
+def _to_text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value).strip()
+
+
+def _empty_columns() -> Dict[str, List[str]]:
+    return {column: [] for column in (*REQUIRED_COLUMNS, *OPTIONAL_COLUMNS)}
+
+
+def iter_csv_chunks(stream: TextIO, chunk_size: int) -> Iterator[Tuple[List[int], Dict[str, List[str]]]]:
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if header is None:
+        return
+    header = [name.strip() for name in header]
+    missing = [c for c in REQUIRED_COLUMNS if c not in header]
+    if missing:
+        raise ImportFormatError(f"Missing required columns: {', '.join(missing)}")
+
+    # Only the columns we know about are kept; extra ones (tags, tc_no, ...) are ignored
+    positions = {c: header.index(c) for c in (*REQUIRED_COLUMNS, *OPTIONAL_COLUMNS) if c in header}
+    defaults = {c: v for c, v in OPTIONAL_COLUMNS.items() if c not in positions}
+    width = len(header)
+
+    lines, columns = [], _empty_columns()
+    for record in reader:
+        if not any(record):
+            continue  # Blank line
+        if len(record) < width:
+            record = record + [""] * (width - len(record))
+        lines.append(reader.line_num)
+        for column, position in positions.items():
+            columns[column].append(record[position].strip())
+        if len(lines) == chunk_size:
+            for column, value in defaults.items():
+                columns[column] = [value] * len(lines)
+            yield lines, columns
+            lines, columns = [], _empty_columns()
+
+    if lines:
+        for column, value in defaults.items():
+            columns[column] = [value] * len(lines)
+        yield lines, columns
+
+
+def iter_ndjson_chunks(stream: TextIO, chunk_size: int) -> Iterator[Tuple[List[int], Dict[str, List[str]]]]:
+    lines, columns = [], _empty_columns()
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        if not isinstance(record, dict):
+            record = {}  # Fails the required-column checks and is reported as a reject
+
+        lines.append(line_number)
+        for column in REQUIRED_COLUMNS:
+            columns[column].append(_to_text(record.get(column)))
+        for column, default in OPTIONAL_COLUMNS.items():
+            value = record.get(column)
+            columns[column].append(default if value is None else _to_text(value))
+
+        if len(lines) == chunk_size:
+            yield lines, columns
+            lines, columns = [], _empty_columns()
+
+    if lines:
+        yield lines, columns
+
+
+# =========================================================
+# Pipeline
+# =========================================================
+
+def _insert_rows(conn: sqlite3.Connection, columns: Dict[str, List[str]], offsets: List[int]) -> int:
+    if not offsets:
+        return 0
+
+    today = date.today().isoformat()
+    account_ids = id_allocator.allocate_account_ids(len(offsets))
+    begin_immediate(conn)
+
+    c = columns
+    rows = [
+        (account_id, c["account_holder_name"][i], c["dob"][i], c["gender"][i], c["email"][i],
+         c["phone"][i], c["address"][i], c["zip_code"][i], c["account_type"][i],
+         float(c["balance"][i]), c["date_opened"][i] or today, c["status"][i], c["services"][i],
+         c["marketing_opt_in"][i].lower() in TRUE_VALUES, c["agreed_to_terms"][i].lower() in TRUE_VALUES)
+        for account_id, i in zip(account_ids, offsets)
+    ]
+    conn.executemany(crud.INSERT_ACCOUNT_SQL, rows)
+    conn.commit()
+    return len(rows)
+
+
+def import_accounts(
+        conn: sqlite3.Connection,
+        stream: TextIO,
+        file_format: FileFormat = FileFormat.csv,
+        chunk_size: int = IMPORT_CHUNK_SIZE
+) -> Dict:
+    """
+    Streams accounts from `stream` into the database, committing one transaction per chunk.
+    Valid rows are imported even when others are rejected; rejects are reported by line number.
+    Raises ImportFormatError if the file as a whole is unusable.
+    """
+    chunks = iter_csv_chunks(stream, chunk_size) if file_format == FileFormat.csv \
+        else iter_ndjson_chunks(stream, chunk_size)
+
+    processed = imported = rejected = 0
+    rejects: List[Dict] = []
+
+    for lines, columns in chunks:
+        errors = validate_chunk(columns)
+        valid_offsets = [i for i in range(len(lines)) if i not in errors]
+        imported += _insert_rows(conn, columns, valid_offsets)
+
+        processed += len(lines)
+        rejected += len(errors)
+        for offset in sorted(errors):
+            if len(rejects) >= MAX_REPORTED_REJECTS:
+                break
+            rejects.append({"line": lines[offset], "errors": errors[offset]})
+
+    return {
+        "processed": processed,
+        "imported": imported,
+        "rejected": rejected,
+        "rejects": rejects,
+        "rejects_truncated": rejected > len(rejects),
+    }
+
+
+def detect_format(filename: Optional[str]) -> FileFormat:
+    if filename and filename.lower().endswith((".ndjson", ".jsonl")):
+        return FileFormat.ndjson
+    return FileFormat.csv
+
+
+def open_text(binary_stream) -> io.TextIOWrapper:
+    # utf-8-sig drops the BOM that spreadsheet exports like to add
+    return io.TextIOWrapper(binary_stream, encoding="utf-8-sig", newline="")
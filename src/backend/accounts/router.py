@@ -1,67 +1,372 @@
-from fastapi import APIRouter, HTTPException, Depends, status, Header
-from typing import List
+import json
+import os
+import sqlite3
+from datetime import date
+from fastapi import APIRouter, HTTPException, Depends, status, Header, Query, Body, UploadFile, File, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
 
 # Import from the new generic module
 import idempotency
-from accounts import crud
-from accounts.schemas import AccountCreate, AccountUpdate, AccountResponse
+import database
+import etags
+import generations
+import timing
+from cache import TTLCache
+from routing import TimedRoute
+from database import get_db, begin_immediate
+from accounts import crud, export, importer, id_allocator
+from accounts.schemas import (
+    AccountCreate, AccountUpdate, AccountResponse, AccountPage, AccountSortField, SortOrder, FileFormat,
+    AccountBulkItem, AccountBulkResponse, BULK_MAX_ITEMS, ImportReport
+)
 from auth import utils
 from auth.schemas import User
 
-router = APIRouter(prefix="/accounts", tags=["accounts"])
+router = APIRouter(prefix="/accounts", tags=["accounts"], route_class=TimedRoute)
 
+EXPORT_BATCH_SIZE = 1000
 
-@router.get("", response_model=List[AccountResponse])
-def get_all_accounts(current_user: User = Depends(utils.get_current_user)):
-    """Auth: Clerk, Manager"""
-    accounts = crud.get_all_accounts()
-    return accounts
+# Read-through cache of GET /accounts/{account_id}: (ETag, response body)
+ACCOUNT_CACHE_SIZE = int(os.getenv("ACCOUNT_CACHE_SIZE", "10000"))
+ACCOUNT_CACHE_TTL = float(os.getenv("ACCOUNT_CACHE_TTL", "60"))
+account_cache = TTLCache(ACCOUNT_CACHE_SIZE, ACCOUNT_CACHE_TTL)
+
+# Clients may keep responses but must revalidate them (If-None-Match) before reuse
+CACHE_CONTROL = "private, no-cache"
+
+
+def serialize_account(account: dict) -> bytes:
+    # Same bytes FastAPI's JSONResponse would produce for response_model=AccountResponse
+    return json.dumps(
+        AccountResponse(**account).dict(), ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def account_etag(account_id: str, version: int) -> str:
+    return etags.make_etag(account_id, version)
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+async def idempotency_claim(idempotency_id: str = Header(..., alias="Idempotency-Id")):
+    """
+    Dependency: idempotency.acquire, with a stuck original request turned into 409 and a reused
+    key into 422. Declare it before get_db, so duplicates wait without a pooled connection.
+    The claim is dropped if the route raises; a claim taken over meanwhile gets 409 too.
+    """
+    in_progress = HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="A request with this Idempotency-Id is still in progress"
+    )
+    try:
+        claim = await idempotency.acquire(idempotency_id)
+    except idempotency.KeyInProgress:
+        raise in_progress
+    except idempotency.KeyReused:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency-Id was already used for a different request"
+        )
+    try:
+        async with idempotency.claimed(claim):
+            yield claim
+    except idempotency.ClaimLost:
+        raise in_progress
+
+
+@router.get("", response_model=AccountPage)
+def get_all_accounts(
+        request: Request,
+        response: Response,
+        limit: int = Query(50, ge=1, le=500),
+        cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+        status: Optional[str] = None,
+        account_type: Optional[str] = None,
+        zip_code: Optional[str] = None,
+        date_opened_from: Optional[date] = None,
+        date_opened_to: Optional[date] = None,
+        sort_by: AccountSortField = AccountSortField.account_id,
+        order: SortOrder = SortOrder.asc,
+        if_none_match: Optional[str] = Header(None),
+        current_user: User = Depends(utils.get_current_user),
+        db: sqlite3.Connection = Depends(get_db)
+):
+    """
+    Auth: Clerk, Manager
+    Cursor-paginated: pass the returned 'next_cursor' back with the same filters and sort.
+    The ETag combines the "accounts" generation with the query, so If-None-Match is answered
+    with 304 before the page is queried.
+    """
+    etag = etags.make_etag(generations.current_generation(db, "accounts"), etags.digest(request.url.query))
+    if not etags.none_match(if_none_match, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+
+    try:
+        items, next_cursor = crud.get_accounts_page(
+            db, limit, cursor=cursor, sort_by=sort_by, order=order,
+            status=status, account_type=account_type, zip_code=zip_code,
+            date_opened_from=date_opened_from, date_opened_to=date_opened_to
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"items": items, "next_cursor": next_cursor}
 
 
 @router.post("", status_code=200)
 def create_account(
         account: AccountCreate,
-        idempotency_id: str = Header(..., alias="Idempotency-Id"),
-        current_user: User = Depends(utils.get_current_user)
+        current_user: User = Depends(utils.get_current_user),
+        claim: idempotency.Claim = Depends(idempotency_claim),
+        db: sqlite3.Connection = Depends(get_db)
 ):
     """
     Auth: Clerk, Manager
     Requires 'Idempotency-Id' header.
+    A retry sent while the original is still running waits for its response (409 if it takes too long).
     """
-    # 1. Generic Check (Reusable)
-    cached_response = idempotency.get_idempotency_key(idempotency_id)
-    if cached_response:
-        return cached_response
+    # 1. Generic Check (Reusable) - already processed, or claimed for this request
+    if claim.response is not None:
+        return claim.response
+
+    # IDs are allocated outside the write lock (see accounts.id_allocator)
+    account_id = id_allocator.allocate_account_id()
 
     # 2. Specific Business Logic (Create Account)
-    result = crud.create_account(account)
+    begin_immediate(db)
+    result = crud.create_account(db, account, account_id)
 
     # 3. Generic Save (Reusable)
-    idempotency.save_idempotency_key(idempotency_id, result)
+    idempotency.save_idempotency_key(db, claim.key, result, claim)
+    with timing.phase("commit"):
+        db.commit()
 
+    idempotency.remember({claim.key: result})
     return result
 
 
+@router.post("/bulk", response_model=AccountBulkResponse)
+def create_accounts_bulk(
+        accounts: List[AccountBulkItem] = Body(..., min_items=1, max_items=BULK_MAX_ITEMS),
+        current_user: User = Depends(utils.get_current_user),
+        claim: idempotency.Claim = Depends(idempotency_claim),
+        db: sqlite3.Connection = Depends(get_db)
+):
+    """
+    Auth: Clerk, Manager
+    Requires 'Idempotency-Id' header for the batch; items may carry their own 'idempotency_id'.
+    All new accounts are inserted in one transaction.
+    """
+    # 1. Whole batch already processed, or claimed for this request
+    if claim.response is not None:
+        return claim.response
+
+    response, saved_responses = _create_accounts_bulk(db, accounts, claim)
+
+    idempotency.remember(saved_responses)
+    return response
+
+
+def _create_accounts_bulk(db: sqlite3.Connection, accounts: List[AccountBulkItem], claim: idempotency.Claim):
+    # One ID per item, allocated outside the write lock; replayed items leave theirs unused
+    account_ids = id_allocator.allocate_account_ids(len(accounts))
+
+    begin_immediate(db)
+
+    # 2. Items already processed under their own key (earlier batch or POST /accounts)
+    item_keys = [a.idempotency_id for a in accounts if a.idempotency_id]
+    item_responses = idempotency.get_idempotency_keys(db, item_keys)
+    pending = idempotency.get_pending_keys(db, set(item_keys) - set(item_responses))
+    if pending:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Items are still being processed under idempotency_id: {', '.join(sorted(pending))}"
+        )
+
+    # 3. Everything else is created; a key repeated inside the batch creates one account
+    to_create, first_index = [], {}
+    for index, account in enumerate(accounts):
+        key = account.idempotency_id
+        if key and (key in item_responses or key in first_index):
+            continue
+        if key:
+            first_index[key] = index
+        to_create.append((index, account))
+
+    created = crud.create_accounts(db, [account for _, account in to_create], account_ids[:len(to_create)])
+    created_by_index = {index: result for (index, _), result in zip(to_create, created)}
+    for key, index in first_index.items():
+        item_responses[key] = created_by_index[index]
+
+    results = []
+    for index, account in enumerate(accounts):
+        if index in created_by_index:
+            results.append({"index": index, **created_by_index[index]})
+        else:
+            results.append({"index": index, **item_responses[account.idempotency_id], "replayed": True})
+
+    response = {
+        "created": len(created),
+        "replayed": len(accounts) - len(created),
+        "results": results
+    }
+
+    # 4. Save the batch key and the new per-item keys together
+    new_item_responses = {key: item_responses[key] for key in first_index}
+    saved_responses = {**new_item_responses, claim.key: response}
+    idempotency.save_idempotency_keys(db, saved_responses, claim)
+
+    with timing.phase("commit"):
+        db.commit()
+    return response, saved_responses
+
+
+@router.post("/import", response_model=ImportReport)
+def import_accounts(
+        file: UploadFile = File(...),
+        format: Optional[FileFormat] = Query(None, description="Defaults to the file extension (.ndjson/.jsonl, else CSV)"),
+        current_user: User = Depends(utils.get_current_user),
+        db: sqlite3.Connection = Depends(get_db)
+):
+    """
+    Auth: Clerk, Manager
+    Imports a CSV/NDJSON file laid out like tests/api_pytest/data/accounts.csv.
+    Rows are validated and committed in chunks; rejected rows are reported by line number.
+    """
+    file_format = format or importer.detect_format(file.filename)
+    stream = importer.open_text(file.file)
+    try:
+        return importer.import_accounts(db, stream, file_format)
+    except importer.ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="File must be UTF-8 encoded")
+    finally:
+        stream.detach()  # Leave closing the upload to FastAPI
+
+
+@router.get("/export")
+def export_accounts(
+        format: FileFormat = FileFormat.ndjson,
+        gzip: bool = Query(False, description="Gzip-compress the stream (Content-Encoding: gzip)"),
+        status: Optional[str] = None,
+        account_type: Optional[str] = None,
+        zip_code: Optional[str] = None,
+        date_opened_from: Optional[date] = None,
+        date_opened_to: Optional[date] = None,
+        current_user: User = Depends(utils.get_current_user)
+):
+    """
+    Auth: Clerk, Manager
+    Streams every matching account as NDJSON or CSV with chunked transfer encoding.
+    """
+    filters = dict(
+        status=status, account_type=account_type, zip_code=zip_code,
+        date_opened_from=date_opened_from, date_opened_to=date_opened_to
+    )
+
+    def stream():
+        # The generator owns its connection: it outlives the request-scoped one
+        with database.connection() as conn:
+            batches = crud.iter_account_batches(conn, EXPORT_BATCH_SIZE, **filters)
+            if format == FileFormat.csv:
+                chunks = export.csv_chunks(batches)
+            else:
+                chunks = export.ndjson_chunks(batches)
+            if gzip:
+                chunks = export.gzip_chunks(chunks)
+            yield from chunks
+
+    if format == FileFormat.csv:
+        media_type, filename = "text/csv", "accounts.csv"
+    else:
+        media_type, filename = "application/x-ndjson", "accounts.ndjson"
+
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(stream(), media_type=media_type, headers=headers)
+
+
 @router.get("/{account_id}", response_model=AccountResponse)
-def get_account(account_id: str, current_user: User = Depends(utils.get_current_user)):
-    """Auth: Clerk, Manager"""
-    account = crud.get_account_by_id(account_id)
-    if account is None:
+def get_account(
+        account_id: str,
+        if_none_match: Optional[str] = Header(None),
+        current_user: User = Depends(utils.get_current_user),
+        db: sqlite3.Connection = Depends(get_db)
+):
+    """
+    Auth: Clerk, Manager
+    Served from account_cache; concurrent misses for one ID share a single lookup.
+    Entries are tagged with the row version, read first by primary key, so writes from other
+    workers invalidate only the rows they changed.
+    The ETag is the row version: a matching If-None-Match gets 304 without a body.
+    """
+    def load():
+        account = crud.get_account_by_id(db, account_id)
+        if account is None:
+            return None
+        return account_etag(account_id, account["version"]), serialize_account(account)
+
+    version = crud.get_account_version(db, account_id)
+    if version is None:
+        account_cache.invalidate(account_id)
         raise HTTPException(status_code=404, detail="Account not found")
-    return account
+    etag = account_etag(account_id, version)
+    if not etags.none_match(if_none_match, etag):
+        return not_modified(etag)
+
+    cached = account_cache.get_or_load(account_id, load, version=version)
+    if cached is None:
+        raise HTTPException(status_code=404, detail="Account not found")  # Deleted meanwhile
+
+    etag, body = cached
+    return Response(
+        content=body, media_type="application/json", headers={"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    )
 
 
 @router.put("/{account_id}")
-def update_account(account_id: str, account: AccountUpdate, current_user: User = Depends(utils.get_current_user)):
-    """Auth: Clerk, Manager"""
-    success = crud.update_account(account_id, account)
-    if not success:
+def update_account(
+        account_id: str,
+        account: AccountUpdate,
+        response: Response,
+        if_match: Optional[str] = Header(None),
+        current_user: User = Depends(utils.get_current_user),
+        db: sqlite3.Connection = Depends(get_db)
+):
+    """
+    Auth: Clerk, Manager
+    Optimistic concurrency: with If-Match, the update only applies if the account still has that ETag (else 412).
+    """
+    # The version check and the update run under one write lock
+    begin_immediate(db)
+    version = crud.get_account_version(db, account_id)
+    if version is None:
+        db.rollback()
         raise HTTPException(status_code=404, detail="Account not found")
+    if not etags.match(if_match, account_etag(account_id, version)):
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail="Account has been modified")
+
+    crud.update_account(db, account_id, account)
+    db.commit()
+    account_cache.invalidate(account_id)
+    generations.tracker.expire()
+    response.headers["ETag"] = account_etag(account_id, version + 1)
     return {"message": "Account updated successfully"}
 
 
 @router.delete("/{account_id}")
-def delete_account(account_id: str, current_user: User = Depends(utils.get_current_user)):
+def delete_account(
+        account_id: str,
+        current_user: User = Depends(utils.get_current_user),
+        db: sqlite3.Connection = Depends(get_db)
+):
     """Auth: MANAGER ONLY"""
     if current_user.role != "manager":
         raise HTTPException(
@@ -69,7 +374,10 @@ def delete_account(account_id: str, current_user: User = Depends(utils.get_curre
             detail="Operation not permitted"
         )
 
-    success = crud.delete_account(account_id)
+    success = crud.delete_account(db, account_id)
     if not success:
         raise HTTPException(status_code=404, detail="Account not found")
+    db.commit()
+    account_cache.invalidate(account_id)
+    generations.tracker.expire()
     return {"message": "Account deleted successfully"}
\ No newline at end of file
@@ -1,3 +1,5 @@
+from enum import Enum
+from typing import Dict, List, Optional
 from pydantic import BaseModel
 
 class AccountCreate(BaseModel):
@@ -22,6 +24,13 @@ class AccountCreate(BaseModel):
     marketing_opt_in: bool
     agreed_to_terms: bool
 
+class AccountBulkItem(AccountCreate):
+    # Optional per-item key, shared with POST /accounts: items already created under it are replayed
+    idempotency_id: Optional[str] = None
+
+# Upper bound on one POST /accounts/bulk request
+BULK_MAX_ITEMS = 1000
+
 class AccountUpdate(BaseModel):
     account_holder_name: str
     dob: str
@@ -51,4 +60,46 @@ class AccountResponse(BaseModel):
     status: str
     services: str
     marketing_opt_in: bool
-    agreed_to_terms: bool
\ No newline at end of file
+    agreed_to_terms: bool
+
+class AccountSortField(str, Enum):
+    account_id = "account_id"
+    balance = "balance"
+    date_opened = "date_opened"
+
+class SortOrder(str, Enum):
+    asc = "asc"
+    desc = "desc"
+
+class FileFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+class AccountPage(BaseModel):
+    items: List[AccountResponse]
+    # Opaque keyset cursor for the next page; None on the last page
+    next_cursor: Optional[str] = None
+
+class AccountBulkResult(BaseModel):
+    index: int
+    account_id: str
+    date_opened: str
+    message: str
+    replayed: bool = False
+
+class AccountBulkResponse(BaseModel):
+    created: int
+    replayed: int
+    results: List[AccountBulkResult]
+
+class ImportReject(BaseModel):
+    line: int
+    errors: Dict[str, str]
+
+class ImportReport(BaseModel):
+    processed: int
+    imported: int
+    rejected: int
+    rejects: List[ImportReject]
+    # True when more rows were rejected than are listed in 'rejects'
+    rejects_truncated: bool
\ No newline at end of file
@@ -0,0 +1,124 @@
+"""
+Password verification off the event loop and off the shared threadpool.
+
+bcrypt is deliberately slow (~50-250 ms of CPU per verify). Run in FastAPI's threadpool, a
+login wave takes the threads that account reads need and contends for the GIL. Here it runs
+in a dedicated process pool, and once HASH_WORKERS + HASH_QUEUE_LIMIT verifications are in
+flight, new logins are rejected right away (HashingBusy -> 503) instead of queueing behind them.
+"""
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from passlib.context import CryptContext
+
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(max((os.cpu_count() or 2) // 2, 1))))
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", "32"))
+
+_context: Optional[CryptContext] = None
+
+
+def _verify(plain_password: str, hashed_password: str):
+    # Runs in a worker process; returns (result, seconds spent hashing)
+    global _context
+    if _context is None:
+        _context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    started = time.perf_counter()
+    result = _context.verify(plain_password, hashed_password)
+    return result, time.perf_counter() - started
+
+
+class HashingBusy(Exception):
+    """Raised when the verification queue is full."""
+
+
+class PasswordHasher:
+    """
+    Process pool for bcrypt with a bounded queue and latency counters.
+    Only used from the event loop, so the counters need no lock.
+    """
+
+    def __init__(self, workers: int = HASH_WORKERS, queue_limit: int = HASH_QUEUE_LIMIT):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._in_flight = 0
+
+        # Statistics
+        self._verified = 0
+        self._rejected = 0
+        self._max_in_flight = 0
+        self._hash_time_total = 0.0
+        self._hash_time_max = 0.0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: forking a process that runs an event loop and holds SQLite connections is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        if self._in_flight >= self.workers + self.queue_limit:
+            self._rejected += 1
+            raise HashingBusy("Too many logins in progress")
+
+        self._in_flight += 1
+        self._max_in_flight = max(self._max_in_flight, self._in_flight)
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            try:
+                result, hash_time = await loop.run_in_executor(
+                    self._get_executor(), _verify, plain_password, hashed_password
+                )
+            except BrokenProcessPool:
+                # A worker died (e.g. OOM-killed): start a fresh pool and retry once
+                self._executor = None
+                result, hash_time = await loop.run_in_executor(
+                    self._get_executor(), _verify, plain_password, hashed_password
+                )
+        finally:
+            self._in_flight -= 1
+
+        wait_time = time.perf_counter() - started - hash_time
+        self._verified += 1
+        self._hash_time_total += hash_time
+        self._hash_time_max = max(self._hash_time_max, hash_time)
+        self._wait_time_total += wait_time
+        self._wait_time_max = max(self._wait_time_max, wait_time)
+        return result
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        verified = self._verified or 1
+        return {
+            "workers": self.workers,
+            "queue_limit": self.queue_limit,
+            "in_flight": self._in_flight,
+            "max_in_flight": self._max_in_flight,
+            "verified": self._verified,
+            "rejected": self._rejected,
+            "hash_time_avg_ms": round(self._hash_time_total / verified * 1000, 2),
+            "hash_time_max_ms": round(self._hash_time_max * 1000, 2),
+            "wait_time_avg_ms": round(self._wait_time_total / verified * 1000, 2),
+            "wait_time_max_ms": round(self._wait_time_max * 1000, 2),
+        }
+
+
+hasher = PasswordHasher()
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await hasher.verify(plain_password, hashed_password)
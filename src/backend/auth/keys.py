@@ -0,0 +1,170 @@
+"""
+JWT signing keys.
+
+JWT_ALGORITHM=HS256 (the default) signs with the shared SECRET_KEY, as before.
+JWT_ALGORITHM=RS256 or ES256 signs with a private key, and publishes the public keys at
+/.well-known/jwks.json, so other nodes verify tokens locally without the secret.
+
+Asymmetric keys are PEM files in JWT_KEYS_DIR named `<kid>.pem`. The newest kid (they sort
+by creation time) signs; every key in the directory verifies, so tokens signed before a
+rotation stay valid until a retired key file is deleted (keep it for REFRESH_TOKEN_EXPIRE_DAYS).
+Workers re-read the directory every JWT_KEYS_RELOAD_SECONDS, and on an unknown kid (at most
+every JWT_KEYS_MIN_RELOAD_SECONDS; kids still unknown after a reload are rejected until the next).
+
+Rotate with:  python -m auth.keys rotate   (from src/backend)
+"""
+import json
+import os
+import secrets
+import sys
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from jose import jwk, jwt, JWTError
+from jose.backends.base import Key
+
+from dotenv import load_dotenv
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SECRET_KEY = os.getenv("SECRET_KEY")
+ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+KEYS_DIR = os.getenv("JWT_KEYS_DIR", os.path.join(BASE_DIR, "keys"))
+KEYS_RELOAD_SECONDS = float(os.getenv("JWT_KEYS_RELOAD_SECONDS", "60"))
+KEYS_MIN_RELOAD_SECONDS = float(os.getenv("JWT_KEYS_MIN_RELOAD_SECONDS", "5"))
+UNKNOWN_KIDS_SIZE = 1000
+
+ASYMMETRIC_ALGORITHMS = ("RS256", "ES256")
+
+
+def _generate_private_key(algorithm: str):
+    if algorithm == "RS256":
+        return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return ec.generate_private_key(ec.SECP256R1())
+
+
+class KeyRing:
+    """Signing key plus every verification key, loaded from KEYS_DIR."""
+
+    def __init__(self, algorithm: str = ALGORITHM, keys_dir: str = KEYS_DIR):
+        if algorithm != "HS256" and algorithm not in ASYMMETRIC_ALGORITHMS:
+            raise ValueError(f"Unsupported JWT_ALGORITHM {algorithm!r}; use HS256, RS256 or ES256")
+        self.algorithm = algorithm
+        self.keys_dir = keys_dir
+        self._lock = threading.Lock()
+        self._signing: Optional[Tuple[str, Key]] = None
+        self._public: Dict[str, Key] = {}
+        self._jwks = b'{"keys":[]}'
+        self._loaded_at = 0.0
+        self._unknown_kids = set()  # Not in the directory at the last load
+
+    @property
+    def asymmetric(self) -> bool:
+        return self.algorithm in ASYMMETRIC_ALGORITHMS
+
+    # --- Key files ---
+
+    def _load(self) -> None:
+        # Caller holds the lock
+        os.makedirs(self.keys_dir, exist_ok=True)
+        kids = sorted(name[:-4] for name in os.listdir(self.keys_dir) if name.endswith(".pem"))
+        if not kids:
+            kids = [self._create_key()]
+
+        public, jwks = {}, []
+        for kid in kids:
+            with open(os.path.join(self.keys_dir, f"{kid}.pem"), "rb") as f:
+                private_key = jwk.construct(f.read(), self.algorithm)
+            public_key = private_key.public_key()
+            public[kid] = public_key
+            jwks.append({**public_key.to_dict(), "kid": kid, "use": "sig", "alg": self.algorithm})
+            if kid == kids[-1]:
+                self._signing = (kid, private_key)
+
+        self._public = public
+        self._jwks = json.dumps({"keys": jwks}, separators=(",", ":")).encode("utf-8")
+        self._loaded_at = time.monotonic()
+        self._unknown_kids = set()
+
+    def _create_key(self) -> str:
+        kid = time.strftime("%Y%m%d%H%M%S", time.gmtime()) + "-" + secrets.token_hex(4)
+        pem = _generate_private_key(self.algorithm).private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        )
+        # Exclusive create, readable by the owner only
+        fd = os.open(os.path.join(self.keys_dir, f"{kid}.pem"), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(pem)
+        return kid
+
+    def _ensure_loaded(self) -> None:
+        with self._lock:
+            if self._signing is None or time.monotonic() - self._loaded_at >= KEYS_RELOAD_SECONDS:
+                self._load()
+
+    def _find_rotated(self, kid: str) -> Optional[Key]:
+        # A kid signed by another worker's new key: reload, unless the directory was read
+        # moments ago or this kid was already missing then (junk kids must not cost disk I/O)
+        with self._lock:
+            key = self._public.get(kid)
+            if (key is None and kid not in self._unknown_kids
+                    and time.monotonic() - self._loaded_at >= KEYS_MIN_RELOAD_SECONDS):
+                self._load()
+                key = self._public.get(kid)
+                if key is None and len(self._unknown_kids) < UNKNOWN_KIDS_SIZE:
+                    self._unknown_kids.add(kid)
+            return key
+
+    def rotate(self) -> str:
+        """Creates a new signing key; older keys keep verifying until their files are removed."""
+        with self._lock:
+            os.makedirs(self.keys_dir, exist_ok=True)
+            kid = self._create_key()
+            self._load()
+            return kid
+
+    # --- Tokens ---
+
+    def sign(self, claims: dict) -> str:
+        if not self.asymmetric:
+            return jwt.encode(claims, SECRET_KEY, algorithm=self.algorithm)
+        self._ensure_loaded()
+        kid, key = self._signing
+        return jwt.encode(claims, key, algorithm=self.algorithm, headers={"kid": kid})
+
+    def verify(self, token: str) -> dict:
+        """Decoded claims of a valid token; raises JWTError otherwise."""
+        if not self.asymmetric:
+            return jwt.decode(token, SECRET_KEY, algorithms=[self.algorithm])
+
+        kid = jwt.get_unverified_header(token).get("kid")
+        if not isinstance(kid, str):
+            raise JWTError("Missing signing key ID")
+        self._ensure_loaded()
+        key = self._public.get(kid)
+        if key is None:
+            key = self._find_rotated(kid)  # Possibly rotated by another worker
+            if key is None:
+                raise JWTError("Unknown signing key")
+        return jwt.decode(token, key, algorithms=[self.algorithm])
+
+    def jwks(self) -> bytes:
+        """JSON Web Key Set of the verification keys (empty for HS256)."""
+        if self.asymmetric:
+            self._ensure_loaded()
+        return self._jwks
+
+
+keyring = KeyRing()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rotate"]:
+        sys.exit("usage: python -m auth.keys rotate")
+    if not keyring.asymmetric:
+        sys.exit("JWT_ALGORITHM is HS256: rotate SECRET_KEY instead")
+    print(f"New signing key: {keyring.rotate()}")
@@ -0,0 +1,246 @@
+"""
+Token revocation.
+
+Every token carries a `jti` (its own ID) and a `fid` (family ID, shared by all tokens that
+descend from one login through /refresh).
+
+- /refresh revokes the presented refresh token's jti as it rotates it. Revoking is an INSERT
+  into revoked_tokens, so when two workers rotate the same token only one of them wins.
+- Presenting an already rotated refresh token again is reuse: somebody kept a copy. The whole
+  family is revoked, logging out both the copy and the legitimate user. A token rotated less than
+  REFRESH_REUSE_GRACE_SECONDS ago is exempt, for tabs (or React StrictMode) refreshing at once.
+- /logout revokes the family, which also rejects the family's unexpired access tokens.
+
+Membership checks on the request path go through RevocationList: a Bloom filter over every
+revoked ID answers the common "not revoked" case without the database, an exact set holds
+recent revocations, and the table settles the rest (Bloom false positives, older entries).
+Each worker pulls rows revoked by other workers every REVOCATION_SYNC_SECONDS.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+import database
+
+logger = logging.getLogger(__name__)
+
+REUSE_GRACE_SECONDS = float(os.getenv("REFRESH_REUSE_GRACE_SECONDS", "30"))
+REVOCATION_SYNC_SECONDS = float(os.getenv("REVOCATION_SYNC_SECONDS", "5"))
+REVOCATION_PURGE_SECONDS = float(os.getenv("REVOCATION_PURGE_SECONDS", "3600"))
+BLOOM_CAPACITY = int(os.getenv("REVOCATION_BLOOM_CAPACITY", "100000"))
+BLOOM_ERROR_RATE = 0.01
+RECENT_SIZE = int(os.getenv("REVOCATION_RECENT_SIZE", "10000"))
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over string IDs, tuned for lookup speed over memory.
+    The size is a power of two, so each probe is a slice of one 128-bit blake2b hash. IDs are
+    hashed even when they are uuid4().hex: their version and variant bits are fixed, not random.
+    Slots are bytes rather than bits (1 MiB for the default capacity), which saves the bit twiddling.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        optimal_size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.slice_bits = max(3, (optimal_size - 1).bit_length())
+        self.size = 1 << self.slice_bits
+        self.hashes = max(1, min(round(self.size / capacity * math.log(2)), 128 // self.slice_bits))
+        self.count = 0
+        self._mask = self.size - 1
+        self._slots = bytearray(self.size)
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest(), "big")
+
+    def add(self, key: str) -> None:
+        h = self._hash(key)
+        for _ in range(self.hashes):
+            self._slots[h & self._mask] = 1
+            h >>= self.slice_bits
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        # _hash inlined: this is the per-request path
+        h = int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest(), "big")
+        slots, mask, slice_bits = self._slots, self._mask, self.slice_bits
+        for _ in range(self.hashes):
+            if not slots[h & mask]:
+                return False
+            h >>= slice_bits
+        return True
+
+
+class RevocationList:
+    """In-memory tiers in front of the revoked_tokens table. Thread-safe."""
+
+    def __init__(self, capacity: int = BLOOM_CAPACITY, recent_size: int = RECENT_SIZE):
+        self.capacity = capacity
+        self.recent_size = recent_size
+        self._lock = threading.Lock()
+        self._bloom = BloomFilter(capacity, BLOOM_ERROR_RATE)
+        self._recent = OrderedDict()  # jti -> expires_at
+        self._synced_until = 0.0  # revoked_at of the newest row pulled from the table
+
+        # Statistics
+        self._bloom_negatives = 0
+        self._recent_hits = 0
+        self._db_checks = 0
+        self._false_positives = 0
+
+    def _remember(self, jti: str, expires_at: float) -> None:
+        # Caller holds the lock
+        if jti not in self._recent:
+            self._bloom.add(jti)
+        self._recent[jti] = expires_at
+        self._recent.move_to_end(jti)
+        while len(self._recent) > self.recent_size:
+            self._recent.popitem(last=False)
+
+    def check(self, jti: str) -> Optional[bool]:
+        """False: not revoked. True: revoked. None: only the table can tell (see is_revoked)."""
+        # Lock-free negative path: bits are only ever set, and a rebuilt filter is swapped in whole
+        if jti not in self._bloom:
+            self._bloom_negatives += 1  # Approximate under concurrency
+            return False
+        with self._lock:
+            expires_at = self._recent.get(jti)
+            if expires_at is not None:
+                self._recent_hits += 1
+                return expires_at > time.time()
+            return None
+
+    def is_revoked(self, conn: sqlite3.Connection, jti: str) -> bool:
+        state = self.check(jti)
+        if state is not None:
+            return state
+        row = lookup(conn, jti)
+        with self._lock:
+            self._db_checks += 1
+            if row is None:
+                self._false_positives += 1
+            else:
+                self._remember(jti, row["expires_at"])
+        return row is not None
+
+    def add(self, jti: str, expires_at: float) -> None:
+        with self._lock:
+            self._remember(jti, expires_at)
+
+    def sync(self, conn: sqlite3.Connection, full: bool = False) -> int:
+        """Pulls revocations made since the last sync (all of them with `full`, rebuilding the filter)."""
+        with self._lock:
+            full = full or self._bloom.count > self._bloom.capacity  # Rebuild a saturated filter, sized up
+            # 1 s overlap: rows committed by other workers can carry a slightly older revoked_at
+            since = 0.0 if full else self._synced_until - 1.0
+        rows = conn.execute(
+            "SELECT jti, revoked_at, expires_at FROM revoked_tokens WHERE revoked_at >= ? AND expires_at > ?",
+            (since, time.time())
+        ).fetchall()
+
+        with self._lock:
+            if full:
+                self._bloom = BloomFilter(max(self.capacity, len(rows) * 2), BLOOM_ERROR_RATE)
+                self._recent.clear()
+            for row in rows:
+                self._remember(row["jti"], row["expires_at"])
+                self._synced_until = max(self._synced_until, row["revoked_at"])
+        return len(rows)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "bloom_entries": self._bloom.count,
+                "bloom_slots": self._bloom.size,
+                "recent": len(self._recent),
+                "bloom_negatives": self._bloom_negatives,
+                "recent_hits": self._recent_hits,
+                "db_checks": self._db_checks,
+                "false_positives": self._false_positives,
+            }
+
+
+revocations = RevocationList()
+
+
+def lookup(conn: sqlite3.Connection, jti: str) -> Optional[sqlite3.Row]:
+    return conn.execute(
+        "SELECT reason, revoked_at, expires_at FROM revoked_tokens WHERE jti=? AND expires_at > ?",
+        (jti, time.time())
+    ).fetchone()
+
+
+def revoke(conn: sqlite3.Connection, jti: str, reason: str, expires_at: float) -> bool:
+    """
+    Records a revocation; False if `jti` was already revoked. The caller commits, then
+    publish()es it: a revocation rolled back must not reach the in-memory tiers.
+    """
+    cursor = conn.execute(
+        "INSERT OR IGNORE INTO revoked_tokens (jti, reason, revoked_at, expires_at) VALUES (?, ?, ?, ?)",
+        (jti, reason, time.time(), expires_at)
+    )
+    return cursor.rowcount == 1
+
+
+def publish(jti: str, expires_at: float) -> None:
+    """Adds a committed revocation to this worker's in-memory tiers (other workers sync it)."""
+    revocations.add(jti, expires_at)
+
+
+def is_rotation_reuse(conn: sqlite3.Connection, jti: str) -> bool:
+    """
+    True when the refresh token `jti` was presented before, outside the grace window.
+    Call after revoke() returned False.
+    """
+    row = lookup(conn, jti)
+    if row is None:
+        return False  # Expired meanwhile; the token itself is expired too
+    return row["reason"] != "rotated" or time.time() - row["revoked_at"] > REUSE_GRACE_SECONDS
+
+
+def purge_expired(conn: sqlite3.Connection) -> int:
+    """Deletes revocations whose tokens have expired. The caller commits."""
+    return conn.execute("DELETE FROM revoked_tokens WHERE expires_at <= ?", (time.time(),)).rowcount
+
+
+def load() -> None:
+    """Fills the in-memory tiers from the table; called at startup."""
+    with database.connection() as conn:
+        revocations.sync(conn, full=True)
+
+
+def is_revoked(jti: str) -> bool:
+    """Table-backed check on a pooled connection, for callers without one (run it in the threadpool)."""
+    with database.connection() as conn:
+        return revocations.is_revoked(conn, jti)
+
+
+def _maintain_once(purge: bool) -> None:
+    with database.connection() as conn:
+        if purge:
+            purge_expired(conn)
+            conn.commit()
+        revocations.sync(conn, full=purge)
+
+
+async def maintain() -> None:
+    """Background task: pulls other workers' revocations, and periodically purges and rebuilds."""
+    last_purge = time.monotonic()
+    while True:
+        await asyncio.sleep(REVOCATION_SYNC_SECONDS)
+        purge = time.monotonic() - last_purge >= REVOCATION_PURGE_SECONDS
+        try:
+            await run_in_threadpool(_maintain_once, purge)
+            if purge:
+                last_purge = time.monotonic()
+        except Exception:
+            logger.exception("Revocation list maintenance failed")
@@ -1,36 +1,72 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Response, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
 from datetime import timedelta
-from jose import JWTError, jwt
+from jose import JWTError
+import logging
+import sqlite3
+import time
+import uuid
 
 from auth.schemas import Token
-from auth import utils, crud
+from auth import utils, crud, hashing, revocation
+from auth.keys import keyring
+import database
+from database import get_db
+from routing import TimedRoute
 
-router = APIRouter(tags=["authentication"])
+router = APIRouter(tags=["authentication"], route_class=TimedRoute)
+logger = logging.getLogger(__name__)
+
+
+def _load_user(username: str):
+    # Own short-lived connection: it goes back to the pool before bcrypt runs
+    with database.connection() as conn:
+        return crud.get_user_by_username(conn, username)
+
+
+def family_expiry() -> float:
+    # A family lives as long as its newest refresh token can
+    return time.time() + utils.REFRESH_TOKEN_EXPIRE_DAYS * 86400
 
 
 @router.post("/token", response_model=Token)
-def login_for_access_token(response: Response, form_data: OAuth2PasswordRequestForm = Depends()):
+async def login_for_access_token(
+        response: Response,
+        form_data: OAuth2PasswordRequestForm = Depends()
+):
     """
     Validates credentials, sets Refresh Token in HttpOnly Cookie, returns Access Token.
+    bcrypt runs in auth.hashing's process pool; when its queue is full the login gets 503.
+    No database connection is held while the password is checked.
     """
-    user = crud.get_user_by_username(form_data.username)
-    if not user or not utils.verify_password(form_data.password, user.hashed_password):
+    user = await run_in_threadpool(_load_user, form_data.username)
+    try:
+        password_ok = user is not None and await hashing.verify_password(form_data.password, user.hashed_password)
+    except hashing.HashingBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many login attempts in progress, retry shortly",
+            headers={"Retry-After": "1"},
+        )
+    if not password_ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    utils.cache_principal(user)
 
     access_token_expires = timedelta(minutes=utils.ACCESS_TOKEN_EXPIRE_MINUTES)
     refresh_token_expires = timedelta(days=utils.REFRESH_TOKEN_EXPIRE_DAYS)
+    family_id = uuid.uuid4().hex  # New token family, see auth/revocation.py
 
     access_token = utils.create_access_token(
-        data={"sub": user.username, "role": user.role},
+        data={"sub": user.username, "role": user.role, "fid": family_id},
         expires_delta=access_token_expires
     )
     refresh_token = utils.create_refresh_token(
-        data={"sub": user.username, "role": user.role},
+        data={"sub": user.username, "role": user.role, "fid": family_id},
         expires_delta=refresh_token_expires
     )
 
@@ -54,10 +90,12 @@ def login_for_access_token(response: Response, form_data: OAuth2PasswordRequestF
 
 
 @router.post("/refresh", response_model=Token)
-def refresh_token(request: Request, response: Response):
+def refresh_token(request: Request, response: Response, db: sqlite3.Connection = Depends(get_db)):
     """
     Reads Refresh Token from Cookie, validates it, and rotates keys.
+    The presented refresh token is revoked; presenting it again revokes its whole family.
     """
+    utils.forget_access_token(request)  # The access token being replaced
     # 1. Get token from cookie instead of body
     refresh_token = request.cookies.get("refresh_token")
 
@@ -71,7 +109,7 @@ def refresh_token(request: Request, response: Response):
         raise credentials_exception
 
     try:
-        payload = jwt.decode(refresh_token, utils.SECRET_KEY, algorithms=[utils.ALGORITHM])
+        payload = keyring.verify(refresh_token)
         username: str = payload.get("sub")
         role: str = payload.get("role")
         if username is None:
@@ -79,24 +117,43 @@ def refresh_token(request: Request, response: Response):
     except JWTError:
         raise credentials_exception
 
-    user = crud.get_user_by_username(username)
+    # 2. Revoke the presented token (tokens issued before revocation existed carry no jti/fid)
+    family_id = payload.get("fid") or uuid.uuid4().hex
+    # The table itself, not the in-memory tiers: a logout on another worker may not be synced yet
+    if revocation.lookup(db, family_id) is not None:
+        raise credentials_exception
+    jti = payload.get("jti")
+    if jti is not None and not revocation.revoke(db, jti, "rotated", payload["exp"]):
+        if revocation.is_rotation_reuse(db, jti):
+            family_expires_at = family_expiry()
+            revocation.revoke(db, family_id, "reuse", family_expires_at)
+            db.commit()
+            revocation.publish(family_id, family_expires_at)
+            logger.warning(f"Refresh token reuse detected for user '{username}'; token family revoked")
+            raise credentials_exception
+
+    user = crud.get_user_by_username(db, username)
     if user is None:
         raise credentials_exception
+    db.commit()
+    if jti is not None:
+        revocation.publish(jti, payload["exp"])
+    utils.cache_principal(user)
 
-    # 2. Rotate Tokens
+    # 3. Rotate Tokens
     access_token_expires = timedelta(minutes=utils.ACCESS_TOKEN_EXPIRE_MINUTES)
     refresh_token_expires = timedelta(days=utils.REFRESH_TOKEN_EXPIRE_DAYS)
 
     new_access_token = utils.create_access_token(
-        data={"sub": user.username, "role": user.role},
+        data={"sub": user.username, "role": user.role, "fid": family_id},
         expires_delta=access_token_expires
     )
     new_refresh_token = utils.create_refresh_token(
-        data={"sub": user.username, "role": user.role},
+        data={"sub": user.username, "role": user.role, "fid": family_id},
         expires_delta=refresh_token_expires
     )
 
-    # 3. Set New Cookie
+    # 4. Set New Cookie
     response.set_cookie(
         key="refresh_token",
         value=new_refresh_token,
@@ -116,9 +173,41 @@ def refresh_token(request: Request, response: Response):
 
 
 @router.post("/logout")
-def logout(response: Response):
+def logout(request: Request, response: Response, db: sqlite3.Connection = Depends(get_db)):
     """
-    Clears the HttpOnly cookie.
+    Clears the HttpOnly cookie and revokes the session's token family,
+    so neither the refresh token nor its access tokens work anymore.
     """
+    utils.forget_access_token(request)
+    scheme, _, access_token = request.headers.get("Authorization", "").partition(" ")
+    tokens = [request.cookies.get("refresh_token"), access_token if scheme.lower() == "bearer" else None]
+
+    family_ids = set()
+    for token in filter(None, tokens):
+        try:
+            family_ids.add(keyring.verify(token).get("fid"))
+        except JWTError:
+            pass  # Expired or invalid: nothing left to revoke
+    family_ids.discard(None)  # Tokens issued before revocation existed
+    family_expires_at = family_expiry()
+    for family_id in family_ids:
+        revocation.revoke(db, family_id, "logout", family_expires_at)
+    db.commit()
+    for family_id in family_ids:
+        revocation.publish(family_id, family_expires_at)
+
     response.delete_cookie(key="refresh_token")
-    return {"message": "Logged out successfully"}
\ No newline at end of file
+    return {"message": "Logged out successfully"}
+
+
+@router.get("/.well-known/jwks.json", include_in_schema=False)
+def jwks():
+    """
+    Public keys for verifying access tokens locally (RS256/ES256; empty for HS256).
+    Verifiers should cache it and re-fetch on an unknown `kid`.
+    """
+    return Response(
+        content=keyring.jwks(),
+        media_type="application/json",
+        headers={"Cache-Control": "public, max-age=300"},
+    )
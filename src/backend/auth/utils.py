@@ -1,12 +1,20 @@
+import hashlib
 import os
+import time
+import uuid
 from datetime import datetime, timedelta, timezone
 from typing import Optional
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-from auth.schemas import TokenData
-from auth import crud
+from jose import JWTError
+from auth.schemas import TokenData, User
+from auth import crud, revocation
+from auth.keys import keyring
+import database
+import timing
+from cache import TTLCache
+from logging_config import request_user_ctx
 
 from dotenv import load_dotenv
 # Load environment variables
@@ -14,15 +22,23 @@ load_dotenv()
 
 # Configuration
 SECRET_KEY = os.getenv("SECRET_KEY")
-ALGORITHM = "HS256"
+ALGORITHM = keyring.algorithm  # JWT_ALGORITHM; see auth/keys.py
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 REFRESH_TOKEN_EXPIRE_DAYS = 7  # New constant
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+# Principal cache: username -> User, so authenticated requests skip the users table
+PRINCIPAL_CACHE_SIZE = int(os.getenv("AUTH_PRINCIPAL_CACHE_SIZE", "1000"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("AUTH_PRINCIPAL_CACHE_TTL", "30"))
+# > 0: trust the token's role claim, without any lookup, for this many seconds after it was issued
+TRUST_CLAIMS_SECONDS = float(os.getenv("AUTH_TRUST_CLAIMS_SECONDS", "0"))
+
+principal_cache = TTLCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
+
+# Verified access tokens: sha256(token) -> claims, each entry expiring at the token's `exp`
+TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+token_cache = TTLCache(TOKEN_CACHE_SIZE, ACCESS_TOKEN_EXPIRE_MINUTES * 60)
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -30,8 +46,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.now(timezone.utc) + expires_delta
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    to_encode.update({"exp": expire, "iat": int(time.time()), "jti": uuid.uuid4().hex})
+    encoded_jwt = keyring.sign(to_encode)
     return encoded_jwt
 
 def create_refresh_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -40,13 +56,86 @@ def create_refresh_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.now(timezone.utc) + expires_delta
     else:
         expire = datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
+    encoded_jwt = keyring.sign(to_encode)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+def _token_key(token: str) -> bytes:
+    return hashlib.sha256(token.encode("utf-8")).digest()
+
+def decode_access_token(token: str) -> dict:
+    """
+    keyring.verify, skipped for tokens that already passed verification.
+    Raises JWTError like jwt.decode; only valid tokens are cached.
+    """
+    key = _token_key(token)
+    payload = token_cache.get(key)
+    if payload is not TTLCache.MISSING:
+        return payload
+
+    payload = keyring.verify(token)
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)) and exp > time.time():
+        token_cache.set(key, payload, ttl=exp - time.time())
+    return payload
+
+def bearer_subject(scope) -> Optional[str]:
+    """`sub` of a valid bearer token in an ASGI scope's headers, else None (for middleware)."""
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer" or not token:
+                return None
+            try:
+                return decode_access_token(token).get("sub")  # Cached after the first request
+            except JWTError:
+                return None
+    return None
+
+def forget_access_token(request: Request) -> None:
+    """Drops the request's bearer token from token_cache (logout, rotation)."""
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        token_cache.invalidate(_token_key(token))
+
+def cache_principal(user: User) -> None:
+    """Stores a freshly read user, e.g. after login, so its first requests hit the cache."""
+    principal_cache.set(user.username, User(username=user.username, role=user.role))
+
+def invalidate_principal(username: Optional[str] = None) -> None:
+    """Call after changing a user (or all users, with no username); other workers catch up within the TTL."""
+    if username is None:
+        principal_cache.clear()
+    else:
+        principal_cache.invalidate(username)
+
+def _load_principal(username: str) -> Optional[User]:
+    with database.connection() as conn:
+        user = crud.get_user_by_username(conn, username)
+    return User(username=user.username, role=user.role) if user is not None else None
+
+def _claims_are_fresh(payload: dict) -> bool:
+    issued_at = payload.get("iat")
+    return (
+        TRUST_CLAIMS_SECONDS > 0
+        and isinstance(issued_at, (int, float))
+        and payload.get("role") is not None
+        and time.time() - issued_at <= TRUST_CLAIMS_SECONDS
+    )
+
+def _identified(user: User) -> User:
+    # Names the request's user in its log records (see logging_config.RequestUser)
+    current = request_user_ctx.get()
+    if current is not None:
+        current.username, current.role = user.username, user.role
+    return user
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
     """
     Dependency to be used by other routes to protect endpoints.
+    Verified tokens come from token_cache, so a token's signature is checked once.
+    Never blocks the event loop: users come from principal_cache, and a miss is loaded
+    in the threadpool (one lookup per username however many requests are waiting).
     """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -54,7 +143,8 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        with timing.phase("jwt"):
+            payload = decode_access_token(token)
         username: str = payload.get("sub")
         role: str = payload.get("role")
         if username is None:
@@ -63,7 +153,25 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except JWTError:
         raise credentials_exception
 
-    user = crud.get_user_by_username(token_data.username)
+    # Logout and refresh-token reuse revoke the whole token family (see auth/revocation.py)
+    family_id = payload.get("fid")
+    if family_id is not None:
+        with timing.phase("revocation"):
+            revoked = revocation.revocations.check(family_id)
+            if revoked is None:
+                revoked = await run_in_threadpool(revocation.is_revoked, family_id)
+        if revoked:
+            raise credentials_exception
+
+    if _claims_are_fresh(payload):
+        return _identified(User(username=token_data.username, role=token_data.role))
+
+    with timing.phase("principal"):
+        user = principal_cache.get(token_data.username)
+        if user is TTLCache.MISSING:
+            user = await run_in_threadpool(
+                principal_cache.get_or_load, token_data.username, lambda: _load_principal(token_data.username)
+            )
     if user is None:
         raise credentials_exception
-    return user
\ No newline at end of file
+    return _identified(user)
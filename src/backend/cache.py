@@ -0,0 +1,147 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class _Flight:
+    """A load in progress; concurrent callers for the same key wait on it."""
+    __slots__ = ("event", "value", "error", "stale")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+        self.stale = False
+
+
+class TTLCache:
+    """
+    Bounded LRU cache with a per-entry TTL, single-flight loading and hit/miss/eviction counters.
+    Thread-safe; used from FastAPI's threadpool.
+
+    Entries can carry a `version` (e.g. a row version, or a generation from generations.py): a lookup with a
+    different version treats the entry as stale, which is how other workers' writes invalidate it.
+    """
+
+    MISSING = object()
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, version, value)
+        self._inflight = {}
+
+        # Statistics
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._stale = 0
+        self._coalesced = 0
+
+    def _lookup(self, key: Hashable, now: float, version: Any) -> Any:
+        # Caller holds the lock
+        entry = self._entries.get(key)
+        if entry is None:
+            return self.MISSING
+        expires_at, entry_version, value = entry
+        if expires_at <= now:
+            del self._entries[key]
+            self._expirations += 1
+            return self.MISSING
+        if version is not None and entry_version != version:
+            del self._entries[key]
+            self._stale += 1
+            return self.MISSING
+        self._entries.move_to_end(key)
+        return value
+
+    def _store(self, key: Hashable, value: Any, ttl: Optional[float], version: Any) -> None:
+        # Caller holds the lock
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), version, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def get(self, key: Hashable, version: Any = None) -> Any:
+        """Returns the cached value or TTLCache.MISSING."""
+        with self._lock:
+            value = self._lookup(key, time.monotonic(), version)
+            if value is self.MISSING:
+                self._misses += 1
+            else:
+                self._hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None, version: Any = None) -> None:
+        with self._lock:
+            self._store(key, value, ttl, version)
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any], version: Any = None) -> Any:
+        """
+        Returns the cached value, or calls `loader()` once for all concurrent callers of the same key.
+        A None result is handed to the waiters but not cached.
+        `version` must be read before loading, so a write racing the load leaves the entry stale, not wrong.
+        """
+        with self._lock:
+            value = self._lookup(key, time.monotonic(), version)
+            if value is not self.MISSING:
+                self._hits += 1
+                return value
+            self._misses += 1
+
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+            else:
+                self._coalesced += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = loader()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+                # An invalidate() during the load means the value may predate a write: don't keep it
+                if flight.error is None and flight.value is not None and not flight.stale:
+                    self._store(key, flight.value, None, version)
+            flight.event.set()
+        return flight.value
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+            flight = self._inflight.get(key)
+            if flight is not None:
+                flight.stale = True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            for flight in self._inflight.values():
+                flight.stale = True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self._hits,
+                "misses": self._misses,
+                "coalesced": self._coalesced,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "stale": self._stale,
+            }
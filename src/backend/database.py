@@ -1,24 +1,477 @@
+import logging
 import sqlite3
 import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Optional
 from passlib.context import CryptContext
 from dotenv import load_dotenv
 
+import timing
+
 # Load environment variables from .env file (looks in root or current dir)
 load_dotenv()
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, "database.db")
 
+logger = logging.getLogger(__name__)
+
 # Setup hashing for seeding (creating default users)
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# --- Connection Pool Configuration ---
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # Seconds to wait for a free connection
+POOL_HEALTHCHECK_INTERVAL = float(os.getenv("DB_POOL_HEALTHCHECK_INTERVAL", "30"))  # Idle seconds before re-checking
 
-def get_connection():
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+# PRAGMA profile applied once to every new connection.
+# WAL lets readers run alongside a writer; NORMAL sync is durable in WAL mode at a fraction of the fsyncs.
+PRAGMAS = {
+    "journal_mode": os.getenv("DB_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("DB_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "cache_size": int(os.getenv("DB_CACHE_SIZE", "-64000")),  # Negative = KiB, i.e. ~64 MB
+    "busy_timeout": int(os.getenv("DB_BUSY_TIMEOUT", "5000")),  # Milliseconds
+    "temp_store": os.getenv("DB_TEMP_STORE", "MEMORY"),
+}
+
+# Column order of the accounts table as created in init_db (used by exports)
+ACCOUNT_COLUMNS = (
+    "account_id", "account_holder_name", "dob", "gender", "email", "phone",
+    "address", "zip_code", "account_type", "balance", "date_opened",
+    "status", "services", "marketing_opt_in", "agreed_to_terms",
+)
+
+
+# --- Query instrumentation ---
+# Every statement run through a PooledConnection is timed and aggregated per normalised SQL text
+# (literals and IN-lists folded), see query_stats. Statements slower than DB_SLOW_QUERY_MS are
+# logged (the log line carries the request's X-Request-Id) together with their query plan.
+QUERY_STATS_ENABLED = os.getenv("DB_QUERY_STATS", "true").lower() == "true"
+SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "100"))
+
+_WHITESPACE = re.compile(r"\s+")
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r"\bIN \(\s*\?(?:\s*,\s*\?)+\s*\)", re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(sql: str) -> str:
+    """One line per statement shape: "WHERE id IN (1, 2)" -> "WHERE id IN (?, ...)"."""
+    sql = _WHITESPACE.sub(" ", sql).strip()
+    sql = _LITERALS.sub("?", sql)
+    return _IN_LISTS.sub("IN (?, ...)", sql)
+
+
+class RequestQueries:
+    """Statements run (and their time) on behalf of one request; set by ObservabilityMiddleware."""
+    __slots__ = ("count", "seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+# Copied into the threadpool with the rest of the context, so sync routes count into it too
+request_queries: ContextVar[Optional[RequestQueries]] = ContextVar("request_queries", default=None)
+
+
+class QueryStats:
+    """Count, total and max time per normalised statement. Thread-safe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._statements = {}  # normalised SQL -> [executions, total seconds, max seconds]
+        self._plans = {}  # normalised SQL -> query plan, captured the first time it was slow
+
+    def record(self, conn, sql: str, parameters, seconds: float, executed: bool = True) -> None:
+        """`executed` is False for time spent fetching the rows of an already counted statement."""
+        key = normalize_sql(sql)
+        with self._lock:
+            entry = self._statements.get(key)
+            if entry is None:
+                entry = self._statements[key] = [0, 0.0, 0.0]
+            entry[0] += executed
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+        current = request_queries.get()
+        if current is not None:
+            current.count += executed
+            current.seconds += seconds
+
+        if seconds * 1000 >= SLOW_QUERY_MS:
+            plan = self._explain(conn, key, sql, parameters)
+            logger.warning(f"Slow query ({seconds * 1000:.1f} ms{'' if executed else ', fetching'}): {key}"
+                           + (f" | plan: {plan}" if plan else ""))
+
+    def _explain(self, conn, key: str, sql: str, parameters) -> Optional[str]:
+        # Once per statement shape; "SCAN accounts" here means a full table scan
+        with self._lock:
+            if key in self._plans:
+                return self._plans[key]
+        plan = None
+        if parameters is not None and sql.lstrip()[:6].upper() in ("SELECT", "UPDATE", "DELETE"):
+            try:
+                rows = sqlite3.Cursor(conn).execute("EXPLAIN QUERY PLAN " + sql, parameters).fetchall()
+                plan = "; ".join(row[3] for row in rows)
+            except sqlite3.Error:
+                pass
+        with self._lock:
+            self._plans[key] = plan
+        return plan
+
+    def snapshot(self, limit: int = 25) -> list:
+        """The `limit` statements with the most total time."""
+        with self._lock:
+            items = sorted(self._statements.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+            plans = dict(self._plans)
+        return [
+            {
+                "sql": sql,
+                "executions": executions,
+                "total_ms": round(total * 1000, 3),
+                "avg_ms": round(total / executions * 1000, 3) if executions else None,
+                "max_ms": round(longest * 1000, 3),
+                "plan": plans.get(sql),
+            }
+            for sql, (executions, total, longest) in items
+        ]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._statements.clear()
+            self._plans.clear()
+
+
+query_stats = QueryStats()
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Times execute() and the fetch*() calls that follow it into query_stats."""
+
+    _sql = None
+    _parameters = None
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._sql, self._parameters = sql, parameters
+            query_stats.record(self.connection, sql, parameters, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._sql, self._parameters = sql, None
+            query_stats.record(self.connection, sql, None, time.perf_counter() - started)
+
+    def _fetched(self, started: float) -> None:
+        if self._sql is not None:
+            query_stats.record(self.connection, self._sql, self._parameters,
+                               time.perf_counter() - started, executed=False)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._fetched(started)
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            self._fetched(started)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._fetched(started)
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection becomes available within POOL_TIMEOUT."""
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    sqlite3 connection that goes back to its pool on close() instead of closing the file.
+    Existing `conn.close()` call sites therefore keep working unchanged.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = None
+        self.last_used = time.monotonic()
+        self.owner_thread = None
+
+    if QUERY_STATS_ENABLED:
+        # Connection.execute() does not go through cursor(), so both are overridden
+        def cursor(self, factory=None):
+            return super().cursor(factory or InstrumentedCursor)
+
+        def execute(self, sql, parameters=()):
+            return self.cursor().execute(sql, parameters)
+
+        def executemany(self, sql, seq_of_parameters):
+            return self.cursor().executemany(sql, seq_of_parameters)
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+        else:
+            self.pool.release(self)
+
+    def dispose(self):
+        """Really closes the underlying sqlite handle."""
+        self.pool = None
+        super().close()
+
+
+def open_connection(db_path=DB_PATH, pragmas=None):
+    """
+    Opens a tuned connection outside any pool; close() really closes it.
+    For long-lived internal users that must not compete with requests for pool slots.
+    """
+    conn = sqlite3.connect(db_path, check_same_thread=False, factory=PooledConnection)
     conn.row_factory = sqlite3.Row
+    for name, value in (PRAGMAS if pragmas is None else pragmas).items():
+        conn.execute(f"PRAGMA {name}={value}")
     return conn
 
 
+class ConnectionPool:
+    """
+    Bounded pool of pre-tuned SQLite connections.
+
+    - Bounded: at most `max_size` connections exist; callers wait up to `timeout` seconds for one.
+    - Thread-aware: connections are opened with check_same_thread=False and handed to one holder
+      at a time (the holder thread is recorded); a forked worker drops the parent's connections.
+    - Health-checked: a connection idle for longer than `healthcheck_interval` is probed with
+      `SELECT 1` on checkout and replaced if the probe fails.
+    """
+
+    def __init__(self, db_path, max_size=POOL_SIZE, timeout=POOL_TIMEOUT,
+                 healthcheck_interval=POOL_HEALTHCHECK_INTERVAL, pragmas=None):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.timeout = timeout
+        self.healthcheck_interval = healthcheck_interval
+        self.pragmas = PRAGMAS if pragmas is None else pragmas
+
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._idle = deque()
+        self._in_use = set()
+        self._opening = 0
+        self._closed = False
+        self._pid = os.getpid()
+
+        # Statistics
+        self._created = 0
+        self._discarded = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+
+    def _connect(self):
+        conn = open_connection(self.db_path, self.pragmas)
+        conn.pool = self
+        return conn
+
+    def _is_healthy(self, conn):
+        if time.monotonic() - conn.last_used < self.healthcheck_interval:
+            return True
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _check_fork(self):
+        # Connections must never be shared across processes (e.g. uvicorn --workers)
+        if self._pid != os.getpid():
+            self._idle.clear()
+            self._in_use.clear()
+            self._opening = 0
+            self._pid = os.getpid()
+
+    def acquire(self):
+        start = time.monotonic()
+        waited = False
+        conn = None
+
+        with self._available:
+            self._check_fork()
+            while True:
+                while self._idle:
+                    candidate = self._idle.pop()  # LIFO keeps the warmest connection in use
+                    if self._is_healthy(candidate):
+                        conn = candidate
+                        break
+                    self._discard(candidate)
+
+                if conn is not None:
+                    self._in_use.add(conn)
+                    break
+                if len(self._in_use) + self._opening < self.max_size:
+                    # Reserve the slot; the file itself is opened outside the lock
+                    self._opening += 1
+                    break
+
+                remaining = self.timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    raise PoolTimeoutError(f"No database connection available after {self.timeout}s")
+                waited = True
+                self._available.wait(remaining)
+
+            self._checkouts += 1
+            if waited:
+                elapsed = time.monotonic() - start
+                self._waits += 1
+                self._wait_time_total += elapsed
+                self._wait_time_max = max(self._wait_time_max, elapsed)
+
+        if conn is None:
+            conn = self._open_reserved()
+
+        conn.owner_thread = threading.get_ident()
+        return conn
+
+    def _open_reserved(self):
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._available:
+                self._opening -= 1
+                self._available.notify()
+            raise
+        with self._available:
+            self._opening -= 1
+            self._created += 1
+            self._in_use.add(conn)
+        return conn
+
+    def release(self, conn):
+        # Never hand a half-finished transaction to the next caller
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            healthy = True
+        except sqlite3.Error:
+            healthy = False
+
+        with self._available:
+            if conn not in self._in_use:
+                return  # Double close() or a connection from before a fork
+            self._in_use.discard(conn)
+            conn.owner_thread = None
+            if healthy and not self._closed:
+                conn.last_used = time.monotonic()
+                self._idle.append(conn)
+            else:
+                self._discard(conn)
+            self._available.notify()
+
+    def _discard(self, conn):
+        self._discarded += 1
+        try:
+            conn.dispose()
+        except sqlite3.Error:
+            pass
+
+    def close_all(self):
+        """Closes idle connections. Connections still checked out are closed when released."""
+        with self._available:
+            self._closed = True
+            while self._idle:
+                self._idle.pop().dispose()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_size": self.max_size,
+                "in_use": len(self._in_use),
+                "idle": len(self._idle),
+                "opening": self._opening,
+                "created": self._created,
+                "discarded": self._discarded,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "wait_time_total_ms": round(self._wait_time_total * 1000, 3),
+                "wait_time_max_ms": round(self._wait_time_max * 1000, 3),
+            }
+
+
+pool = ConnectionPool(DB_PATH)
+
+
+def get_connection():
+    """
+    Checks a connection out of the pool. Calling `conn.close()` returns it to the pool.
+    """
+    return pool.acquire()
+
+
+@contextmanager
+def connection():
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def get_db():
+    """
+    FastAPI dependency: one pooled connection (and one transaction) per request.
+    Routes call `db.commit()` once their work is done; anything left uncommitted,
+    e.g. after an exception, is rolled back when the connection returns to the pool.
+    """
+    with connection() as conn:
+        yield conn
+
+
+def begin_immediate(conn):
+    """
+    Starts a write transaction right away instead of at the first write,
+    so the reads that follow cannot interleave with another writer.
+    """
+    if not conn.in_transaction:
+        with timing.phase("write_lock"):
+            conn.execute("BEGIN IMMEDIATE")
+
+
+def get_pool_stats():
+    return pool.stats()
+
+
+def close_pool():
+    pool.close_all()
+
+
+def _add_column(cursor, table: str, column: str, definition: str) -> None:
+    """ALTER TABLE ... ADD COLUMN, unless the column already exists."""
+    columns = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
 def init_db():
     conn = get_connection()
     cursor = conn.cursor()
@@ -40,9 +493,20 @@ def init_db():
         status TEXT NOT NULL DEFAULT 'Active',
         services TEXT,
         marketing_opt_in BOOLEAN NOT NULL DEFAULT 0,
-        agreed_to_terms BOOLEAN NOT NULL DEFAULT 0
+        agreed_to_terms BOOLEAN NOT NULL DEFAULT 0,
+        version INTEGER NOT NULL DEFAULT 1
     )
     """)
+    # Databases created before optimistic concurrency (ETags) lack the row version
+    _add_column(cursor, "accounts", "version", "INTEGER NOT NULL DEFAULT 1")
+
+    # Indexes backing the filters and sort orders of GET /accounts.
+    # account_id is appended so keyset pagination can seek straight to (value, account_id).
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_accounts_status ON accounts (status, account_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_accounts_account_type ON accounts (account_type, account_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_accounts_zip_code ON accounts (zip_code, account_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_accounts_date_opened ON accounts (date_opened, account_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_accounts_balance ON accounts (balance, account_id)")
 
     # --- 2. Users Table ---
     cursor.execute("""
@@ -58,11 +522,81 @@ def init_db():
     CREATE TABLE IF NOT EXISTS idempotency_keys (
         key TEXT PRIMARY KEY,
         response_json TEXT NOT NULL,
-        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        status TEXT NOT NULL DEFAULT 'done'
+    )
+    """)
+    # 'pending' rows are claims held by requests still running (idempotency.acquire)
+    _add_column(cursor, "idempotency_keys", "status", "TEXT NOT NULL DEFAULT 'done'")
+    # Keys taken by IdempotencyMiddleware: request fingerprint and the raw HTTP response
+    _add_column(cursor, "idempotency_keys", "fingerprint", "TEXT")
+    _add_column(cursor, "idempotency_keys", "status_code", "INTEGER")
+    _add_column(cursor, "idempotency_keys", "headers_json", "TEXT")
+    _add_column(cursor, "idempotency_keys", "body", "BLOB")
+    # Marks whose claim a 'pending' row is, so a request whose claim was taken over cannot save
+    _add_column(cursor, "idempotency_keys", "claim_token", "TEXT")
+
+    # Expired keys are swept by created_at (idempotency.sweep_expired_keys)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created_at ON idempotency_keys (created_at)")
+
+    # --- 4. ID Sequences (counter + permutation key for accounts.id_allocator) ---
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS id_sequences (
+        name TEXT PRIMARY KEY,
+        seed INTEGER NOT NULL,
+        next_value INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    cursor.execute("INSERT OR IGNORE INTO id_sequences (name, seed, next_value) VALUES (?, ?, 0)",
+                   ("accounts", random.getrandbits(62)))
+
+    # --- 5. Table Generations (cross-worker cache invalidation, see generations.py) ---
+    # Triggers bump a counter in the same transaction as the write, so every worker
+    # sharing database.db can tell whether what it cached is still current.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS table_generations (
+        name TEXT PRIMARY KEY,
+        generation INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    generation_triggers = {
+        # name: (table, events)
+        "accounts": ("accounts", ("INSERT", "UPDATE", "DELETE")),  # Collection reads; single rows have `version`
+        "users": ("users", ("INSERT", "UPDATE", "DELETE")),
+    }
+    for name, (table, events) in generation_triggers.items():
+        cursor.execute("INSERT OR IGNORE INTO table_generations (name, generation) VALUES (?, 0)", (name,))
+        for event in events:
+            trigger = f"trg_generation_{name.replace('.', '_')}_{event.lower()}"
+            cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {trigger} AFTER {event} ON {table}
+            BEGIN
+                UPDATE table_generations SET generation = generation + 1 WHERE name = '{name}';
+            END
+            """)
+
+    # --- 6. Revoked Tokens (refresh token rotation and logout, see auth/revocation.py) ---
+    # `jti` is a token ID or a whole token family ID; rows are purged once expires_at has passed.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS revoked_tokens (
+        jti TEXT PRIMARY KEY,
+        reason TEXT NOT NULL,
+        revoked_at REAL NOT NULL,
+        expires_at REAL NOT NULL
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_revoked_tokens_expires_at ON revoked_tokens (expires_at)")
+
+    # --- 7. Rate Limits (token buckets shared by workers when RATE_LIMIT_BACKEND=sqlite) ---
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS rate_limits (
+        key TEXT PRIMARY KEY,
+        tokens REAL NOT NULL,
+        updated REAL NOT NULL
     )
     """)
 
-    # --- 4. Seed Default Users ---
+    # --- 8. Seed Default Users ---
     # Fetch Credentials from .env
     clerk_user = os.getenv("CLERK_USERNAME")
     clerk_pass = os.getenv("CLERK_PASSWORD")
@@ -87,4 +621,4 @@ def init_db():
 
 
 if __name__ == "__main__":
-    init_db()
\ No newline at end of file
+    init_db()
@@ -0,0 +1,55 @@
+"""
+Entity tags for conditional requests (RFC 9110, section 8.8.3 and 13.1).
+
+ETags are built from version counters that already exist (a row's `version`, a
+table generation), so checking `If-None-Match` never needs the response body.
+"""
+import hashlib
+from typing import List, Optional
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag from version parts, e.g. make_etag("1234567", 3) -> '"1234567.3"'."""
+    return '"' + ".".join(str(part) for part in parts) + '"'
+
+
+def digest(text: str) -> str:
+    """Short stable digest, for folding query strings into an ETag."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def parse_etags(header: Optional[str]) -> List[str]:
+    """Splits an If-Match / If-None-Match value into its entity tags ("*" included)."""
+    if not header:
+        return []
+    return [tag.strip() for tag in header.split(",") if tag.strip()]
+
+
+def _opaque(tag: str) -> str:
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def none_match(header: Optional[str], etag: str) -> bool:
+    """
+    True when If-None-Match does NOT match `etag`, i.e. the full response must be sent.
+    Uses the weak comparison, as required for If-None-Match.
+    """
+    tags = parse_etags(header)
+    if not tags:
+        return True
+    if "*" in tags:
+        return False
+    return _opaque(etag) not in {_opaque(tag) for tag in tags}
+
+
+def match(header: Optional[str], etag: Optional[str]) -> bool:
+    """
+    True when the If-Match precondition holds for the current `etag` (None: no current resource).
+    Uses the strong comparison: weak tags never match.
+    """
+    tags = parse_etags(header)
+    if not tags:
+        return True
+    if etag is None:
+        return False
+    return "*" in tags or etag in tags
@@ -0,0 +1,60 @@
+"""
+Cross-worker cache invalidation.
+
+Several uvicorn workers share one database.db, so a worker's in-process caches go stale as
+soon as another worker writes. Triggers created in database.init_db bump a per-table counter
+in `table_generations` inside the writing transaction. Readers compare the counter they
+cached under with the current one: a single primary-key read on a tiny table instead of
+re-reading and re-serialising the data.
+
+GENERATION_CHECK_INTERVAL (seconds, default 0) lets a worker reuse the counters it read
+for that long. 0 re-reads on every check, which keeps read-your-writes across workers.
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict
+
+GENERATION_CHECK_INTERVAL = float(os.getenv("GENERATION_CHECK_INTERVAL", "0"))
+
+
+class GenerationTracker:
+
+    def __init__(self, check_interval: float = GENERATION_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._generations: Dict[str, int] = {}
+        self._checked_at = 0.0
+        self._reads = 0
+
+    def current(self, conn: sqlite3.Connection, name: str) -> int:
+        """Current generation of `name` ("accounts" or "users")."""
+        if self.check_interval > 0:
+            with self._lock:
+                if time.monotonic() - self._checked_at < self.check_interval and name in self._generations:
+                    return self._generations[name]
+
+        # All counters in one read: the table holds a handful of rows
+        rows = conn.execute("SELECT name, generation FROM table_generations").fetchall()
+        with self._lock:
+            self._generations = {row[0]: row[1] for row in rows}
+            self._checked_at = time.monotonic()
+            self._reads += 1
+            return self._generations.get(name, 0)
+
+    def expire(self) -> None:
+        """Forces the next current() to re-read, e.g. right after this worker committed a write."""
+        with self._lock:
+            self._checked_at = 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"generations": dict(self._generations), "reads": self._reads}
+
+
+tracker = GenerationTracker()
+
+
+def current_generation(conn: sqlite3.Connection, name: str) -> int:
+    return tracker.current(conn, name)
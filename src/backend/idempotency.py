@@ -1,62 +1,566 @@
+import asyncio
+import hashlib
 import json
+import logging
+import os
+import re
 import sqlite3
-from typing import Optional, Dict, Any
-from database import get_connection
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, Iterable, Sequence, Tuple
 
+from fastapi.concurrency import run_in_threadpool
 
-def delete_expired_keys():
+import database
+import timing
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Front tier: responses saved (or read) in the last few minutes, so retries skip the table.
+# Only committed responses go in, so a rolled-back request can never be replayed from memory.
+RECENT_KEYS_TTL = float(os.getenv("IDEMPOTENCY_MEMORY_TTL", "300"))
+RECENT_KEYS_SIZE = int(os.getenv("IDEMPOTENCY_MEMORY_SIZE", "10000"))
+recent_keys = TTLCache(RECENT_KEYS_SIZE, RECENT_KEYS_TTL)
+
+# Background expiry (see sweep_expired_keys)
+SWEEP_INTERVAL = float(os.getenv("IDEMPOTENCY_SWEEP_SECONDS", "300"))
+SWEEP_BATCH_SIZE = int(os.getenv("IDEMPOTENCY_SWEEP_BATCH", "500"))
+
+# Claims (see acquire): how long a duplicate waits for the original request, and after how
+# long an unfinished claim is considered abandoned (its request crashed) and can be taken over.
+WAIT_TIMEOUT = float(os.getenv("IDEMPOTENCY_WAIT_TIMEOUT", "10"))
+CLAIM_TIMEOUT = int(os.getenv("IDEMPOTENCY_CLAIM_TIMEOUT", "60"))
+POLL_INTERVAL = 0.05
+
+OWNER, PENDING, DONE = "owner", "pending", "done"
+
+# Claims held by this worker: key -> Event set when the claim is released (event loop only)
+_claims: Dict[str, asyncio.Event] = {}
+
+
+class KeyInProgress(Exception):
+    """Another request holds the key and did not finish within WAIT_TIMEOUT."""
+
+
+class KeyReused(Exception):
+    """The key was already used for a different request (method, path, body or user)."""
+
+
+class ClaimLost(Exception):
+    """The claim outlived CLAIM_TIMEOUT and another request took the key over."""
+
+
+class Claim:
+    """
+    What acquire() got for a key: the saved `response` of a request that already ran, or else
+    this request holds the key, as the 'pending' row marked with `token`.
     """
-    Deletes any keys older than 24 hours using SQLite native time functions.
+    __slots__ = ("key", "token", "response")
+
+    def __init__(self, key: str, token: Optional[str] = None, response: Any = None):
+        self.key = key
+        self.token = token
+        self.response = response
+
+
+def delete_expired_keys(conn: sqlite3.Connection, batch_size: int = SWEEP_BATCH_SIZE) -> int:
+    """
+    Deletes up to `batch_size` keys older than 24 hours (via idx_idempotency_keys_created_at).
+    Small batches keep each write lock short. Returns the number deleted; the caller commits.
     """
-    conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("DELETE FROM idempotency_keys WHERE created_at < datetime('now', '-24 hours')")
-    conn.commit()
-    conn.close()
+    cursor.execute("""
+        DELETE FROM idempotency_keys WHERE rowid IN (
+            SELECT rowid FROM idempotency_keys WHERE created_at < datetime('now', '-24 hours') LIMIT ?
+        )
+    """, (batch_size,))
+    return cursor.rowcount
+
+
+def remember(responses: Dict[str, Dict[str, Any]]) -> None:
+    """Adds committed responses to the front tier. Call after the caller's commit."""
+    for key, response_data in responses.items():
+        recent_keys.set(key, response_data)
 
 
-def get_idempotency_key(key: str) -> Optional[Dict[str, Any]]:
+def get_recent_response(key: str) -> Optional[Dict[str, Any]]:
+    """Front tier only: a response committed by this worker in the last few minutes, or None."""
+    response_data = recent_keys.get(key)
+    return None if response_data is TTLCache.MISSING else response_data
+
+
+def get_idempotency_key(conn: sqlite3.Connection, key: str) -> Optional[Dict[str, Any]]:
     """
     Fetches the response ONLY if the key exists AND is fresh (created within last 24h).
     """
-    conn = get_connection()
+    response_data = get_recent_response(key)
+    if response_data is not None:
+        return response_data
+
     cursor = conn.cursor()
 
-    cursor.execute("""
-        SELECT response_json 
-        FROM idempotency_keys 
-        WHERE key=? 
-          AND created_at > datetime('now', '-24 hours')
-    """, (key,))
+    with timing.phase("idem_read"):
+        cursor.execute("""
+            SELECT response_json 
+            FROM idempotency_keys 
+            WHERE key=? 
+              AND status='done'
+              AND fingerprint IS NULL
+              AND created_at > datetime('now', '-24 hours')
+        """, (key,))
 
-    row = cursor.fetchone()
-    conn.close()
+        row = cursor.fetchone()
 
     if row:
-        return json.loads(row["response_json"])
+        response_data = json.loads(row["response_json"])
+        recent_keys.set(key, response_data)
+        return response_data
     return None
 
 
-def save_idempotency_key(key: str, response_data: Dict[str, Any]) -> None:
+def save_idempotency_key(conn: sqlite3.Connection, key: str, response_data: Dict[str, Any],
+                         claim: Optional[Claim] = None) -> None:
     """
-    Saves a response to the database and cleans up old keys.
+    Saves a response on the caller's connection (expired keys are swept in the background).
+    Nothing is committed here: the key becomes visible together with the caller's own writes,
+    and a failed save raises so the caller rolls them back. With the `claim` on `key`, raises
+    ClaimLost (call inside a write transaction, then roll back) if it was taken over meanwhile.
     """
-    # 1. Clean up old keys first
-    delete_expired_keys()
-
-    # 2. Insert/Replace the new key
-    conn = get_connection()
+    if claim is not None:
+        _check_claim(conn, claim)
     cursor = conn.cursor()
 
     response_json = json.dumps(response_data)
 
-    try:
+    with timing.phase("idem_write"):
         cursor.execute(
             "INSERT OR REPLACE INTO idempotency_keys (key, response_json, created_at) VALUES (?, ?, datetime('now'))",
             (key, response_json)
         )
+
+
+def get_idempotency_keys(conn: sqlite3.Connection, keys: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Batch version of get_idempotency_key: returns {key: response} for the fresh keys that exist.
+    """
+    found = {}
+    for key in set(keys):
+        response_data = get_recent_response(key)
+        if response_data is not None:
+            found[key] = response_data
+    keys = [key for key in set(keys) if key not in found]
+    cursor = conn.cursor()
+
+    for i in range(0, len(keys), 500):
+        chunk = keys[i:i + 500]
+        with timing.phase("idem_read"):
+            cursor.execute(f"""
+                SELECT key, response_json 
+                FROM idempotency_keys 
+                WHERE key IN ({','.join('?' * len(chunk))}) 
+                  AND status='done'
+                  AND fingerprint IS NULL
+                  AND created_at > datetime('now', '-24 hours')
+            """, chunk)
+            rows = cursor.fetchall()
+        for row in rows:
+            found[row["key"]] = json.loads(row["response_json"])
+            recent_keys.set(row["key"], found[row["key"]])
+
+    return found
+
+
+def save_idempotency_keys(conn: sqlite3.Connection, responses: Dict[str, Dict[str, Any]],
+                          claim: Optional[Claim] = None) -> None:
+    """
+    Batch version of save_idempotency_key, written with a single executemany.
+    """
+    if claim is not None:
+        _check_claim(conn, claim)
+    cursor = conn.cursor()
+    with timing.phase("idem_write"):
+        cursor.executemany(
+            "INSERT OR REPLACE INTO idempotency_keys (key, response_json, created_at) VALUES (?, ?, datetime('now'))",
+            [(key, json.dumps(response_data)) for key, response_data in responses.items()]
+        )
+
+
+def _claim_state(conn: sqlite3.Connection, key: str,
+                 fingerprint: Optional[str]) -> Tuple[Optional[str], Optional[sqlite3.Row]]:
+    row = conn.execute("""
+        SELECT status, fingerprint, response_json, status_code, headers_json, body,
+               created_at > datetime('now', ?) AS claim_is_live
+        FROM idempotency_keys
+        WHERE key=? AND created_at > datetime('now', '-24 hours')
+    """, (f"-{CLAIM_TIMEOUT} seconds", key)).fetchone()
+    if row is None or (row["status"] != DONE and not row["claim_is_live"]):
+        return None, None
+    if row["fingerprint"] != fingerprint:
+        raise KeyReused(key)
+    return (DONE, row) if row["status"] == DONE else (PENDING, None)
+
+
+def claim_key(conn: sqlite3.Connection, key: str, fingerprint: Optional[str] = None) -> Tuple[str, Any]:
+    """
+    Tries to take `key`. Returns (OWNER, token) if this request now holds it, (DONE, row)
+    if it has a saved response, or (PENDING, None) if another request holds it.
+    The claim is committed right away (its own short transaction), so every worker sees it;
+    `token` marks this claim's row, so a later takeover is not mistaken for it.
+    Raises KeyReused if the key was taken with a different `fingerprint`.
+    """
+    state, row = _claim_state(conn, key, fingerprint)  # Plain read first: no write lock for duplicates
+    if state is not None:
+        return state, row
+
+    token = uuid.uuid4().hex
+    database.begin_immediate(conn)
+    try:
+        state, row = _claim_state(conn, key, fingerprint)
+        if state is None:
+            conn.execute(
+                "INSERT OR REPLACE INTO idempotency_keys (key, response_json, created_at, status, fingerprint, claim_token) "
+                "VALUES (?, 'null', datetime('now'), 'pending', ?, ?)",
+                (key, fingerprint, token)
+            )
         conn.commit()
-    except sqlite3.Error as e:
-        print(f"Error saving idempotency key: {e}")
+    except Exception:
+        conn.rollback()
+        raise
+
+    if state is not None:
+        return state, row
+    return OWNER, token
+
+
+def _try_claim(key: str, fingerprint: Optional[str]) -> Tuple[str, Any]:
+    with database.connection() as conn:
+        return claim_key(conn, key, fingerprint)
+
+
+async def _acquire(key: str, fingerprint: Optional[str], timeout: float) -> Tuple[str, Any]:
+    # Each attempt borrows a pooled connection for its own short transaction; between
+    # attempts the request waits on the event loop, holding neither a thread nor a connection
+    deadline = time.monotonic() + timeout
+    while True:
+        state, result = await run_in_threadpool(_try_claim, key, fingerprint)
+        if state == OWNER:
+            _claims[key] = asyncio.Event()
+            return state, result
+        if state == DONE:
+            return state, result
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise KeyInProgress(key)
+        event = _claims.get(key)
+        try:
+            if event is not None:
+                await asyncio.wait_for(event.wait(), remaining)  # Held by this worker: woken on release
+            else:
+                await asyncio.sleep(min(remaining, POLL_INTERVAL))  # Held by another worker: poll the table
+        except asyncio.TimeoutError:
+            pass
+
+
+async def acquire(key: str, timeout: float = WAIT_TIMEOUT) -> Claim:
+    """
+    Single-flight for idempotent requests. Returns a Claim with the saved response if `key` was
+    already processed, waiting up to `timeout` for a request that holds it; else this request
+    now holds the key, and must run its work inside `claimed(claim)` and save with the claim.
+    Raises KeyInProgress if the holder does not finish in time, KeyReused if the key
+    belongs to a request made through IdempotencyMiddleware.
+    Call it before taking a pooled connection (e.g. before get_db): waiting needs none.
+    """
+    response_data = get_recent_response(key)
+    if response_data is not None:
+        return Claim(key, response=response_data)
+
+    with timing.phase("idem_read"):
+        state, result = await _acquire(key, None, timeout)
+    if state == OWNER:
+        return Claim(key, token=result)
+    response_data = json.loads(result["response_json"])
+    recent_keys.set(key, response_data)
+    return Claim(key, response=response_data)
+
+
+def _notify(key: str) -> None:
+    # Wakes the requests of this worker waiting for `key` (event loop only)
+    event = _claims.pop(key, None)
+    if event is not None:
+        event.set()
+
+
+def _check_claim(conn: sqlite3.Connection, claim: Claim) -> None:
+    # In the caller's write transaction: a claim older than CLAIM_TIMEOUT may have been taken
+    # over, and then the late original must roll back instead of saving over the new holder
+    row = conn.execute(
+        "SELECT 1 FROM idempotency_keys WHERE key=? AND claim_token=? AND status='pending'",
+        (claim.key, claim.token)
+    ).fetchone()
+    if row is None:
+        raise ClaimLost(claim.key)
+
+
+def release(claim: Claim) -> None:
+    """Drops a claim that will not be saved (only this request's own row), so a retry can run."""
+    with database.connection() as conn:
+        conn.execute(
+            "DELETE FROM idempotency_keys WHERE key=? AND claim_token=? AND status='pending'",
+            (claim.key, claim.token)
+        )
+        conn.commit()
+
+
+@asynccontextmanager
+async def claimed(claim: Claim):
+    """
+    Wraps the work of the request holding `claim` (nothing to do for a saved response).
+    The work must save the response with the claim and commit; if it raises, the claim
+    is dropped so a retry can run.
+    """
+    if claim.token is None:
+        yield
+        return
+    try:
+        yield
+    except BaseException:
+        await run_in_threadpool(release, claim)
+        raise
     finally:
-        conn.close()
\ No newline at end of file
+        _notify(claim.key)
+
+
+def get_pending_keys(conn: sqlite3.Connection, keys: Iterable[str]) -> list:
+    """The keys among `keys` currently claimed by a running request."""
+    keys = list(set(keys))
+    pending = []
+    for i in range(0, len(keys), 500):
+        chunk = keys[i:i + 500]
+        rows = conn.execute(f"""
+            SELECT key FROM idempotency_keys
+            WHERE key IN ({','.join('?' * len(chunk))}) AND status='pending'
+              AND created_at > datetime('now', ?)
+        """, (*chunk, f"-{CLAIM_TIMEOUT} seconds")).fetchall()
+        pending.extend(row["key"] for row in rows)
+    return pending
+
+
+def _sweep_batch() -> int:
+    with database.connection() as conn:
+        deleted = delete_expired_keys(conn)
+        conn.commit()
+    return deleted
+
+
+async def sweep_expired_keys() -> None:
+    """
+    Background task (started in main.py's lifespan): every IDEMPOTENCY_SWEEP_SECONDS, deletes
+    expired keys in batches of IDEMPOTENCY_SWEEP_BATCH until none are left.
+    """
+    while True:
+        try:
+            total = 0
+            while True:
+                deleted = await run_in_threadpool(_sweep_batch)
+                total += deleted
+                if deleted < SWEEP_BATCH_SIZE:
+                    break
+            if total:
+                logger.info(f"Swept {total} expired idempotency keys")
+        except Exception:
+            logger.exception("Idempotency key sweep failed")
+        await asyncio.sleep(SWEEP_INTERVAL)
+
+
+# --- Any route: IdempotencyMiddleware ---
+
+MAX_RESPONSE_BYTES = int(os.getenv("IDEMPOTENCY_MAX_RESPONSE_BYTES", str(1024 * 1024)))
+UNSTORED_HEADERS = frozenset({b"set-cookie", b"date", b"server"})
+
+
+def _bearer_subject(scope) -> Optional[str]:
+    from auth import utils  # Imported late: auth.utils pulls in the whole auth stack
+    return utils.bearer_subject(scope)
+
+
+def _fingerprint(scope, subject: str, body: bytes) -> str:
+    """sha256 of method, path, query string, user and body: what a retry must repeat exactly."""
+    h = hashlib.sha256()
+    for part in (scope["method"], scope["path"], scope.get("query_string", b"").decode("latin-1"), subject):
+        h.update(part.encode("utf-8") + b"\0")
+    h.update(body)
+    return h.hexdigest()
+
+
+async def load_response(key: str, fingerprint: str, timeout: float = WAIT_TIMEOUT) -> Claim:
+    """
+    acquire() for IdempotencyMiddleware: a Claim with the saved (status code, headers, body)
+    of `key` as its response, or held by this request.
+    """
+    state, result = await _acquire(key, fingerprint, timeout)
+    if state == OWNER:
+        return Claim(key, token=result)
+    headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in json.loads(result["headers_json"])]
+    response = (result["status_code"], headers, result["body"])
+    recent_keys.set(("http", key), (fingerprint, response))
+    return Claim(key, response=response)
+
+
+def save_response(claim: Claim, fingerprint: str, response: Tuple[int, list, bytes]) -> None:
+    """Stores the response of the request holding `claim`, unless the key was taken over meanwhile."""
+    status_code, headers, body = response
+    headers_json = json.dumps([[name.decode("latin-1"), value.decode("latin-1")] for name, value in headers],
+                              separators=(",", ":"))
+    with database.connection() as conn:
+        saved = conn.execute(
+            "UPDATE idempotency_keys SET status='done', status_code=?, headers_json=?, body=? "
+            "WHERE key=? AND claim_token=? AND status='pending'",
+            (status_code, headers_json, body, claim.key, claim.token)
+        ).rowcount
+        conn.commit()
+    if saved:
+        recent_keys.set(("http", claim.key), (fingerprint, response))
+
+
+class IdempotencyMiddleware:
+    """
+    Pure ASGI: requests to the configured routes that carry an Idempotency-Id header and a valid
+    bearer token run once (without a token they go straight to the route's 401). `routes` are (method, path template) pairs, e.g. ("PUT", "/accounts/{account_id}").
+
+    The first request with a key runs normally; a 2xx response (status, headers, body) is stored
+    under the key and replayed to every retry, from memory when recent. Other responses are not
+    stored, so the client can fix the request and retry with the same key. A key reused for a
+    different request (method, path, body or user) gets 422; one still being processed, 409.
+    """
+
+    def __init__(self, app, routes: Sequence[Tuple[str, str]]):
+        self.app = app
+        self.routes = [(method.upper(), self._compile(path), path) for method, path in routes]
+
+    @staticmethod
+    def _compile(path: str):
+        parts = re.split(r"(\{[^}]+\})", path)
+        return re.compile("".join("[^/]+" if part.startswith("{") else re.escape(part) for part in parts) + "$")
+
+    def _key(self, scope) -> Optional[str]:
+        if scope["type"] != "http":
+            return None
+        method, path = scope["method"], scope["path"]
+        template = next((t for m, pattern, t in self.routes if method == m and pattern.match(path)), None)
+        if template is None:
+            return None
+        scope["route_template"] = template  # For metrics: replays and rejections answer before routing
+        for name, value in scope["headers"]:
+            if name == b"idempotency-id":
+                return value.decode("latin-1") or None
+        return None
+
+    async def __call__(self, scope, receive, send):
+        key = self._key(scope)
+        subject = _bearer_subject(scope) if key is not None else None
+        if subject is None:
+            # No key, or a request the route will reject with 401: no claim (and no write lock) for it
+            await self.app(scope, receive, send)
+            return
+
+        body, receive = await self._buffer_body(receive)
+        fingerprint = _fingerprint(scope, subject, body)
+
+        recent = recent_keys.get(("http", key))
+        if recent is not TTLCache.MISSING:
+            if recent[0] != fingerprint:
+                await self._reject(send, 422, "Idempotency-Id was already used for a different request")
+            else:
+                await self._replay(send, recent[1])
+            return
+
+        try:
+            claim = await load_response(key, fingerprint)
+        except KeyInProgress:
+            await self._reject(send, 409, "A request with this Idempotency-Id is still in progress")
+            return
+        except KeyReused:
+            await self._reject(send, 422, "Idempotency-Id was already used for a different request")
+            return
+        if claim.response is not None:
+            await self._replay(send, claim.response)
+            return
+
+        await self._run_once(scope, receive, send, claim, fingerprint)
+
+    async def _run_once(self, scope, receive, send, claim: Claim, fingerprint: str) -> None:
+        status_code, headers, chunks, size = None, [], [], 0
+        storable = False
+
+        async def send_and_capture(message):
+            nonlocal status_code, headers, size, storable
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = [(name, value) for name, value in message.get("headers", ())
+                           if name.lower() not in UNSTORED_HEADERS]
+                storable = 200 <= status_code < 300
+            elif message["type"] == "http.response.body" and storable:
+                chunk = message.get("body", b"")
+                size += len(chunk)
+                if size > MAX_RESPONSE_BYTES:
+                    storable = False
+                    chunks.clear()
+                else:
+                    chunks.append(chunk)
+            await send(message)
+
+        async with claimed(claim):
+            await self.app(scope, receive, send_and_capture)
+            if storable:
+                await run_in_threadpool(save_response, claim, fingerprint, (status_code, headers, b"".join(chunks)))
+            else:
+                await run_in_threadpool(release, claim)
+
+    @staticmethod
+    async def _buffer_body(receive):
+        # The fingerprint needs the whole body; the app then reads it from the buffer
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body = b"".join(chunks)
+        replayed = False
+
+        async def buffered_receive():
+            nonlocal replayed
+            if replayed:
+                return await receive()
+            replayed = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        return body, buffered_receive
+
+    @staticmethod
+    async def _replay(send, response: Tuple[int, list, bytes]) -> None:
+        status_code, headers, body = response
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [*headers, (b"idempotent-replayed", b"true")],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    @staticmethod
+    async def _reject(send, status_code: int, detail: str) -> None:
+        body = json.dumps({"detail": detail}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,57 @@
+"""
+Bulk-imports accounts from a CSV or NDJSON file straight into the database,
+using the same streaming pipeline as POST /accounts/import.
+
+Usage (from the repository root):
+    python src/backend/import_accounts.py tests/api_pytest/data/accounts.csv
+"""
+import argparse
+import json
+import sys
+import time
+
+import database
+from accounts import importer, id_allocator
+from accounts.schemas import FileFormat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import accounts from a CSV or NDJSON file.")
+    parser.add_argument("path", help="File to import")
+    parser.add_argument("--format", choices=[f.value for f in FileFormat],
+                        help="Defaults to the file extension (.ndjson/.jsonl, else CSV)")
+    parser.add_argument("--chunk-size", type=int, default=importer.IMPORT_CHUNK_SIZE,
+                        help="Rows validated and committed per transaction")
+    parser.add_argument("--rejects", help="Write rejected rows as NDJSON to this file")
+    args = parser.parse_args()
+
+    file_format = FileFormat(args.format) if args.format else importer.detect_format(args.path)
+
+    start = time.monotonic()
+    with open(args.path, "rb") as f, database.connection() as conn:
+        try:
+            report = importer.import_accounts(conn, importer.open_text(f), file_format, args.chunk_size)
+        except importer.ImportFormatError as e:
+            sys.exit(f"Import failed: {e}")
+    elapsed = time.monotonic() - start
+
+    rate = report["processed"] / elapsed * 60 if elapsed else 0
+    print(f"Processed {report['processed']} rows in {elapsed:.2f}s ({rate:,.0f} rows/min): "
+          f"{report['imported']} imported, {report['rejected']} rejected")
+
+    if args.rejects:
+        with open(args.rejects, "w", encoding="utf-8") as out:
+            for reject in report["rejects"]:
+                out.write(json.dumps(reject) + "\n")
+        if report["rejects_truncated"]:
+            print(f"Only the first {len(report['rejects'])} rejects were written to {args.rejects}")
+    else:
+        for reject in report["rejects"][:20]:
+            print(f"  line {reject['line']}: {reject['errors']}")
+
+    id_allocator.allocator.close()
+    database.close_pool()
+
+
+if __name__ == "__main__":
+    main()
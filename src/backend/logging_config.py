@@ -1,25 +1,244 @@
+import gzip
+import json
 import logging
+import queue
+import shutil
 import sys
 import os
-from logging.handlers import TimedRotatingFileHandler
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, TimedRotatingFileHandler
 from contextvars import ContextVar
+from typing import Optional
+
+# Request threads and the event loop only enqueue records; one listener thread writes them in batches.
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # INFO/DEBUG records beyond this are dropped
+LOG_QUEUE_RESERVE = int(os.getenv("LOG_QUEUE_RESERVE", "1000"))  # Extra room kept for WARNING and above
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "256"))  # Records written per flush, at most
+LOG_SHUTDOWN_TIMEOUT = float(os.getenv("LOG_SHUTDOWN_TIMEOUT", "2"))  # Seconds to drain the queue on shutdown
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # or "json": one object per line, see JsonFormatter
 
 # 1. Context Variables (Global)
 request_id_ctx = ContextVar("request_id", default="-")
 process_id_ctx = ContextVar("process_id", default="-")
 
 
+class RequestUser:
+    """Who made the request; set by ObservabilityMiddleware, filled in by auth.utils.get_current_user."""
+    __slots__ = ("username", "role")
+
+    def __init__(self):
+        self.username = None
+        self.role = None
+
+
+request_user_ctx = ContextVar("request_user", default=None)
+
+# The request's timing.RequestTimings, set by ObservabilityMiddleware
+request_timings_ctx = ContextVar("request_timings", default=None)
+
+
 class ContextFilter(logging.Filter):
     """
-    Injects IDs into every log record (File OR Terminal).
+    Injects IDs (and the authenticated user, if any) into every log record (File OR Terminal).
     """
 
     def filter(self, record):
         record.request_id = request_id_ctx.get()
         record.process_id = process_id_ctx.get()
+        user = request_user_ctx.get()
+        record.user = user.username if user is not None else None
+        record.role = user.role if user is not None else None
         return True
 
 
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, always with the same keys. The access log fills method, route,
+    status, duration_ms and timings (ms per phase, passed as `extra`); on other records they are null.
+    """
+    FIELDS = ("method", "route", "status", "duration_ms", "timings")
+
+    def format(self, record):
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", None),
+            "process_id": getattr(record, "process_id", None),
+            "user": getattr(record, "user", None),
+            "role": getattr(record, "role", None),
+        }
+        for field in self.FIELDS:
+            entry[field] = getattr(record, field, None)
+        entry["message"] = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+# Message args of these types are safe to format later, on the listener thread
+DEFERRED_ARG_TYPES = frozenset({str, int, float, bool, type(None)})
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Enqueues records for the listener. Runs the context filter here, on the caller's thread,
+    where the request's context variables are set; formatting is left to the listener.
+    Below WARNING, records that find `limit` records queued are dropped (counted in `dropped`)
+    rather than waited for. WARNING and above are never dropped: they use the room the queue
+    keeps beyond `limit`, and only wait for the listener once that is full too.
+    """
+
+    def __init__(self, log_queue, limit: int):
+        super().__init__(log_queue)
+        self.limit = limit
+        self.dropped = 0
+
+    def prepare(self, record):
+        # %-style messages whose args are all immutable scalars are merged by the listener; others
+        # now, since their args (or a non-string msg) may be mutated once the caller moves on. The root logger's handler
+        # runs last, so the record is updated in place instead of copied.
+        args = record.args
+        if not isinstance(record.msg, str) or (
+                args and not (type(args) is tuple and all(type(arg) in DEFERRED_ARG_TYPES for arg in args))):
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if record.levelno >= logging.WARNING:
+            self.queue.put(record)
+            return
+        if self.queue.qsize() >= self.limit:
+            self.dropped += 1  # An INFO burst must never block a request
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _BatchFlushMixin:
+    """While the listener writes a batch, flush() is deferred to the end of the batch."""
+    deferred = False
+
+    def flush(self):
+        if not self.deferred:
+            super().flush()
+
+
+class BatchedStreamHandler(_BatchFlushMixin, logging.StreamHandler):
+    pass
+
+
+class BatchedTimedRotatingFileHandler(_BatchFlushMixin, TimedRotatingFileHandler):
+    """Daily file whose rotated copies are gzip-compressed on a background thread."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.namer = lambda name: name + ".gz"
+        self.rotator = self._rotate
+
+    @staticmethod
+    def _rotate(source: str, dest: str) -> None:
+        # Only a rename on the listener thread; compression happens next to it
+        plain = dest[:-len(".gz")]
+        os.rename(source, plain)
+        threading.Thread(target=_gzip_file, args=(plain, dest), name="log-gzip", daemon=True).start()
+
+
+def _gzip_file(source: str, dest: str) -> None:
+    try:
+        with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.remove(source)
+    except OSError:
+        logging.getLogger(__name__).exception(f"Could not compress rotated log {source}")
+
+
+class LogPipeline:
+    """The queue handler installed on the root logger, and the listener thread behind it."""
+
+    def __init__(self, handlers, queue_size: int = LOG_QUEUE_SIZE, batch_size: int = LOG_BATCH_SIZE,
+                 reserve: int = LOG_QUEUE_RESERVE):
+        self.handlers = handlers
+        self.batch_size = batch_size
+        self.queue = queue.Queue(queue_size + reserve)
+        self.queue_handler = DroppingQueueHandler(self.queue, queue_size)
+        self.queue_handler.addFilter(ContextFilter())
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="log-listener", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            for handler in self.handlers:
+                handler.deferred = True
+            for record in batch:
+                if record is None:
+                    continue
+                for handler in self.handlers:
+                    if record.levelno >= handler.level:
+                        handler.handle(record)
+            for handler in self.handlers:
+                handler.deferred = False
+                handler.flush()
+
+            if any(record is None for record in batch):
+                return
+
+    def stats(self) -> dict:
+        return {"queued": self.queue.qsize(), "dropped": self.queue_handler.dropped}
+
+    def stop(self, timeout: float = LOG_SHUTDOWN_TIMEOUT) -> None:
+        """
+        Writes what is queued (waiting at most `timeout` seconds), then attaches the handlers to
+        the root logger directly, so records logged later in the shutdown are written too.
+        """
+        if self._thread is None:
+            return
+        root = logging.getLogger()
+        root.removeHandler(self.queue_handler)
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        self._thread = None
+        for handler in self.handlers:
+            handler.addFilter(ContextFilter())  # Now called on the logging thread itself
+            root.addHandler(handler)
+
+
+pipeline: Optional[LogPipeline] = None
+
+
+def get_log_stats() -> dict:
+    """Records waiting for the listener, and INFO/DEBUG records dropped because the queue was full."""
+    return pipeline.stats() if pipeline is not None else {}
+
+
+def shutdown_logging() -> None:
+    """Drains the log queue; called from main.py's lifespan on shutdown."""
+    if pipeline is not None:
+        pipeline.stop()
+
+
 def setup_logging():
     # 2. Create 'logs' directory if it doesn't exist
     if not os.path.exists("logs"):
@@ -30,18 +249,14 @@ def setup_logging():
         "[%(asctime)s] [%(levelname)s] "
         "[X-Process-Id:%(process_id)s] [X-Request-Id:%(request_id)s] - %(message)s"
     )
-    formatter = logging.Formatter(log_format)
-
-    # 4. Create the Context Filter
-    ctx_filter = ContextFilter()
+    formatter = JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(log_format)
 
     # --- HANDLER 1: Console (Terminal) ---
-    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler = BatchedStreamHandler(sys.stdout)
     console_handler.setFormatter(formatter)
-    console_handler.addFilter(ctx_filter)
 
-    # --- HANDLER 2: File (Rotating Daily) ---
-    file_handler = TimedRotatingFileHandler(
+    # --- HANDLER 2: File (Rotating Daily, older days gzip-compressed) ---
+    file_handler = BatchedTimedRotatingFileHandler(
         filename="logs/banking_system.log",
         when="midnight",  # Rotate every night at 00:00
         interval=1,
@@ -49,19 +264,22 @@ def setup_logging():
         encoding="utf-8"
     )
     file_handler.setFormatter(formatter)
-    file_handler.addFilter(ctx_filter)
 
-    # 5. Configure Root Logger
+    # 4. Configure Root Logger
     logger = logging.getLogger()
     logger.setLevel(logging.INFO)
 
     # Clear existing handlers to avoid duplicates on reload
+    global pipeline
+    if pipeline is not None:
+        pipeline.stop()
     if logger.handlers:
         logger.handlers = []
 
-    # Add both handlers
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+    # Both handlers sit behind the queue (which runs the context filter as records are enqueued)
+    pipeline = LogPipeline([console_handler, file_handler])
+    logger.addHandler(pipeline.queue_handler)
+    pipeline.start()
 
     # Silence noisy default logs from libraries
-    logging.getLogger("uvicorn.access").setLevel(logging.WARNING)
\ No newline at end of file
+    logging.getLogger("uvicorn.access").setLevel(logging.WARNING)
@@ -1,13 +1,24 @@
 # src/backend/main.py
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+import asyncio
 import uvicorn
 import logging
 
-from logging_config import setup_logging
+from logging_config import setup_logging, shutdown_logging, get_log_stats
 from middleware import ObservabilityMiddleware
+import ratelimit
+from ratelimit import RateLimitMiddleware, RateLimitRule
 import database
+import generations
+import metrics
+import idempotency
+from idempotency import IdempotencyMiddleware
+from accounts import id_allocator
+from accounts.router import account_cache
+from auth import hashing, revocation, utils
 from auth.router import router as auth_router
 from accounts.router import router as accounts_router
 
@@ -18,8 +29,18 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     logger.info("Application starting up...")
     database.init_db()
+    id_allocator.allocator.rebuild()
+    revocation.load()
+    revocation_task = asyncio.create_task(revocation.maintain())
+    sweeper_task = asyncio.create_task(idempotency.sweep_expired_keys())
     yield
     logger.info("Shutting down...")
+    revocation_task.cancel()
+    sweeper_task.cancel()
+    hashing.hasher.shutdown()
+    id_allocator.allocator.close()
+    database.close_pool()
+    shutdown_logging()
 
 app = FastAPI(
     title="Bank Management System",
@@ -27,7 +48,32 @@ app = FastAPI(
     lifespan=lifespan
 )
 
-app.add_middleware(ObservabilityMiddleware)
+# Idempotency-Id on PUT/DELETE: innermost, so rate-limited requests never take a key.
+# POST /accounts and /accounts/bulk handle their keys themselves (per item, in the same transaction).
+app.add_middleware(
+    IdempotencyMiddleware,
+    routes=[
+        ("PUT", "/accounts/{account_id}"),
+        ("DELETE", "/accounts/{account_id}"),
+    ],
+)
+# Rate limits per route class, checked in order; the first matching rule applies, so specific
+# routes come before their prefix.
+# Added before the other middleware so 429s still get CORS headers and a log line.
+app.add_middleware(
+    RateLimitMiddleware,
+    rules=[
+        # Login: bcrypt is expensive, and per-IP buckets slow down password guessing
+        RateLimitRule("login", "/token", rate=1, burst=10, key="ip", methods=["POST"]),
+        RateLimitRule("refresh", "/refresh", rate=1, burst=10, key="ip", methods=["POST"]),
+        # Accounts: per user, so one runaway script cannot starve the other users
+        RateLimitRule("accounts-bulk", "/accounts/bulk", rate=1, burst=5, key="user", methods=["POST"]),
+        RateLimitRule("accounts-import", "/accounts/import", rate=0.1, burst=3, key="user", methods=["POST"]),
+        RateLimitRule("accounts-export", "/accounts/export", rate=0.2, burst=5, key="user", methods=["GET"]),
+        RateLimitRule("accounts-write", "/accounts", rate=20, burst=50, key="user", methods=["POST", "PUT", "DELETE"]),
+        RateLimitRule("accounts-read", "/accounts", rate=50, burst=100, key="user", methods=["GET"]),
+    ],
+)
 
 # Enable CORS for the new Vite frontend (default port 5173)
 origins = [
@@ -37,12 +83,16 @@ origins = [
     "http://127.0.0.1:9000"
 ]
 
+# Server-Timing is readable from the frontend's Resource Timing too (Timing-Allow-Origin)
+app.add_middleware(ObservabilityMiddleware, timing_allow_origins=origins)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Idempotent-Replayed", "Server-Timing"],  # ETag lets the frontend send If-Match on updates
 )
 
 app.include_router(auth_router)
@@ -52,5 +102,56 @@ app.include_router(accounts_router)
 def health_check():
     return {"status": "healthy"}
 
+@app.get("/health/pool")
+def pool_stats():
+    """Connection pool usage, for sizing DB_POOL_SIZE."""
+    return database.get_pool_stats()
+
+@app.get("/health/cache")
+def cache_stats():
+    """Hit/miss/eviction counters of the account read cache, and the last generations read."""
+    return {**account_cache.stats(), **generations.tracker.stats()}
+
+@app.get("/health/hashing")
+def hashing_stats():
+    """Password verification pool: queue depth, rejections and bcrypt latency."""
+    return hashing.hasher.stats()
+
+@app.get("/health/ratelimit")
+def ratelimit_stats():
+    """Rate limiter backend, live buckets and 429s per rule."""
+    return ratelimit.default_limiter.stats()
+
+@app.get("/health/queries")
+def query_stats(limit: int = 25):
+    """The SQL statements with the most total time (normalised), with the plan of slow ones."""
+    return database.query_stats.snapshot(limit)
+
+@app.get("/health/logging")
+def logging_stats():
+    """Log queue depth, and records dropped because it was full (raise LOG_QUEUE_SIZE if this grows)."""
+    return get_log_stats()
+
+@app.get("/health/revocation")
+def revocation_stats():
+    """Revoked-token tiers: Bloom filter size and how many checks each tier answered."""
+    return revocation.revocations.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus scrape endpoint. Async: the request metrics are only touched on the event loop."""
+    text = metrics.render({
+        "db_pool": database.get_pool_stats(),
+        "account_cache": account_cache.stats(),
+        "token_cache": utils.token_cache.stats(),
+        "principal_cache": utils.principal_cache.stats(),
+        "idempotency_cache": idempotency.recent_keys.stats(),
+        "ratelimit": ratelimit.default_limiter.stats() if not ratelimit.default_limiter.blocking else {},
+        "hashing": hashing.hasher.stats(),
+        "revocation": revocation.revocations.stats(),
+        "logging": get_log_stats(),
+    })
+    return PlainTextResponse(text, media_type=metrics.CONTENT_TYPE)
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=9000, reload=True)
\ No newline at end of file
@@ -1,37 +1,134 @@
+import os
+import random
+import time
 import uuid
 import logging
-from starlette.middleware.base import BaseHTTPMiddleware
-from fastapi import Request
-from logging_config import request_id_ctx, process_id_ctx
+
+import database
+import metrics
+import timing
+from logging_config import request_id_ctx, process_id_ctx, request_user_ctx, request_timings_ctx, RequestUser
 
 logger = logging.getLogger(__name__)
 
+# Paths answered without an access log line (load balancer / k8s probes), matched exactly:
+# /health/pool and the other diagnostics endpoints keep theirs
+QUIET_PATHS = frozenset(path.strip() for path in os.getenv("ACCESS_LOG_QUIET_PATHS", "/health").split(",") if path.strip())
+
+# Access log sampling: errors (4xx/5xx) and requests slower than ACCESS_LOG_SLOW_MS are always
+# logged, other requests with probability ACCESS_LOG_SAMPLE_RATE (e.g. 0.01). Metrics count them all.
+ACCESS_LOG_SAMPLE_RATE = float(os.getenv("ACCESS_LOG_SAMPLE_RATE", "1.0"))
+ACCESS_LOG_SLOW_MS = float(os.getenv("ACCESS_LOG_SLOW_MS", "500"))
+
+# Server-Timing response header with the request's phases (see timing.py); the access log has them either way
+SERVER_TIMING = os.getenv("SERVER_TIMING", "true").lower() == "true"
+
+
+def keep_access_log(status_code: int, duration_ms: float) -> bool:
+    return (
+        ACCESS_LOG_SAMPLE_RATE >= 1.0
+        or status_code >= 400
+        or duration_ms >= ACCESS_LOG_SLOW_MS
+        or random.random() < ACCESS_LOG_SAMPLE_RATE
+    )
+
+
+class ObservabilityMiddleware:
+    """
+    Pure ASGI: the app runs in the same task (no call_next task or body stream wrapping),
+    so streaming responses and background tasks pass straight through.
+    Also records each request's latency, status and database statements into metrics.requests,
+    and times its phases (timing.RequestTimings) for the Server-Timing header and the access log.
+    """
+
+    def __init__(self, app, quiet_paths=QUIET_PATHS, server_timing: bool = SERVER_TIMING,
+                 timing_allow_origins=()):
+        self.app = app
+        self.quiet_paths = frozenset(quiet_paths)
+        self.server_timing = server_timing
+        self.timing_allow_origin = ", ".join(timing_allow_origins).encode("latin-1")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-class ObservabilityMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
         # 1. EXTRACT OR GENERATE IDs
-        req_id = request.headers.get("X-Request-Id") or str(uuid.uuid4())
-        proc_id = request.headers.get("X-Process-Id") or "N/A"
+        req_id = proc_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                req_id = value.decode("latin-1")
+            elif name == b"x-process-id":
+                proc_id = value.decode("latin-1")
+        req_id = req_id or str(uuid.uuid4())
+        proc_id = proc_id or "N/A"
+
+        id_headers = [(b"x-request-id", req_id.encode("latin-1"))]
+        if proc_id != "N/A":
+            id_headers.append((b"x-process-id", proc_id.encode("latin-1")))
+        status_code = None
+        timings = timing.RequestTimings()
+
+        async def send_with_ids(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                # 4. INJECT HEADERS INTO RESPONSE (replacing any the app set)
+                status_code = message["status"]
+                headers = [(name, value) for name, value in message.get("headers", ())
+                           if name not in (b"x-request-id", b"x-process-id")]
+                headers += id_headers
+                if self.server_timing:
+                    # Everything up to the response start; streamed bodies come after it
+                    value = timings.header(time.perf_counter() - started, queries)
+                    headers.append((b"server-timing", value.encode("latin-1")))
+                    if self.timing_allow_origin:
+                        headers.append((b"timing-allow-origin", self.timing_allow_origin))
+                message = {**message, "headers": headers}
+            await send(message)
 
         # 2. SET CONTEXT
         req_token = request_id_ctx.set(req_id)
         proc_token = process_id_ctx.set(proc_id)
 
+        queries = database.RequestQueries()
+        queries_token = database.request_queries.set(queries)
+        user_token = request_user_ctx.set(RequestUser())
+        timings_token = request_timings_ctx.set(timings)
+
+        started = time.perf_counter()
+        metrics.requests.in_flight += 1
         try:
             # 3. PROCESS THE REQUEST
-            response = await call_next(request)
-
-            # --- NEW LOG LINE HERE ---
-            logger.info(f"{request.method} {request.url.path} - HTTP/1.1 {response.status_code}")
-
-            # 4. INJECT HEADERS INTO RESPONSE
-            response.headers["X-Request-Id"] = req_id
-            if proc_id != "N/A":
-                response.headers["X-Process-Id"] = proc_id
+            await self.app(scope, receive, send_with_ids)
 
-            return response
+            path = scope["path"]
+            if path not in self.quiet_paths and logger.isEnabledFor(logging.INFO):
+                duration_ms = (time.perf_counter() - started) * 1000
+                if keep_access_log(status_code, duration_ms):
+                    # %-style with scalar args: the line is formatted on the log listener thread
+                    # (see logging_config.DroppingQueueHandler.prepare); only the phases are rendered here
+                    logger.info(
+                        "%s %s - HTTP/1.1 %s (%.1f ms, %d queries in %.1f ms)%s",
+                        scope["method"], path, status_code, duration_ms, queries.count, queries.seconds * 1000,
+                        str(timings),
+                        extra={
+                            "method": scope["method"],
+                            "route": metrics.route_template(scope),
+                            "status": status_code,
+                            "duration_ms": round(duration_ms, 2),
+                            "timings": timings.as_dict(),
+                        },
+                    )
 
         finally:
             # 5. CLEANUP
+            metrics.requests.in_flight -= 1
+            metrics.requests.observe(
+                scope["method"], metrics.route_template(scope), status_code or 500, time.perf_counter() - started,
+                queries.count, queries.seconds
+            )
+            database.request_queries.reset(queries_token)
+            request_timings_ctx.reset(timings_token)
+            request_user_ctx.reset(user_token)
             request_id_ctx.reset(req_token)
-            process_id_ctx.reset(proc_token)
\ No newline at end of file
+            process_id_ctx.reset(proc_token)
@@ -0,0 +1,198 @@
+"""
+Rate limiting: token buckets per (rule, client), enforced by a pure ASGI middleware.
+
+Rules are declared in main.py. Each names a route class (path prefix + methods), a key
+("ip", or "user" for the bearer token's subject, falling back to the IP) and a bucket:
+`rate` requests per second sustained, up to `burst` at once. Only the first matching rule
+applies, so list specific routes before their prefix; a request over it gets 429 with
+Retry-After, before it reaches the route.
+
+Buckets live in process memory by default (sharded locks, no I/O). RATE_LIMIT_BACKEND=sqlite
+keeps them in database.db instead, so all workers share one budget per client, at the cost
+of a write transaction per limited request (run in the threadpool).
+"""
+import json
+import math
+import os
+import threading
+import time
+import zlib
+from collections import Counter
+from typing import List, Optional, Sequence
+
+from fastapi.concurrency import run_in_threadpool
+
+import database
+import metrics
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+SHARDS = 16
+IDLE_BUCKET_SECONDS = 3600  # Buckets untouched this long are dropped (they would be full anyway)
+
+
+class RateLimitRule:
+    """`rate` requests/second sustained with bursts of `burst`, per key, for one route class."""
+    __slots__ = ("name", "path_prefix", "methods", "rate", "burst", "key")
+
+    def __init__(self, name: str, path_prefix: str, rate: float, burst: int,
+                 key: str = "ip", methods: Optional[Sequence[str]] = None):
+        if key not in ("ip", "user"):
+            raise ValueError(f"Unknown rate limit key {key!r}")
+        self.name = name
+        self.path_prefix = path_prefix
+        self.methods = frozenset(m.upper() for m in methods) if methods else None
+        self.rate = rate
+        self.burst = burst
+        self.key = key
+
+    def matches(self, method: str, path: str) -> bool:
+        if self.methods is None:
+            if method == "OPTIONS":
+                return False  # CORS preflights are never limited
+        elif method not in self.methods:
+            return False
+        return path == self.path_prefix or path.startswith(self.path_prefix.rstrip("/") + "/")
+
+
+class MemoryRateLimiter:
+    """Token buckets in a dict per shard; a key only ever contends with keys of its shard."""
+    blocking = False
+
+    def __init__(self, shards: int = SHARDS):
+        self.rejected = Counter()  # rule name -> 429s sent
+        self._shards = [(threading.Lock(), {}) for _ in range(shards)]
+        self._pruned_at = time.monotonic()
+
+    def consume(self, key: str, rate: float, burst: int) -> float:
+        """Takes one token; returns 0 if allowed, else the seconds until a token is available."""
+        lock, buckets = self._shards[zlib.crc32(key.encode("utf-8")) % len(self._shards)]
+        now = time.monotonic()
+        with lock:
+            tokens, updated = buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens < 1:
+                buckets[key] = (tokens, now)
+                return (1 - tokens) / rate
+            buckets[key] = (tokens - 1, now)
+
+        if now - self._pruned_at > IDLE_BUCKET_SECONDS:
+            self._prune(now)
+        return 0.0
+
+    def _prune(self, now: float) -> None:
+        self._pruned_at = now
+        for lock, buckets in self._shards:
+            with lock:
+                for key in [k for k, (_, updated) in buckets.items() if now - updated > IDLE_BUCKET_SECONDS]:
+                    del buckets[key]
+
+    def stats(self) -> dict:
+        buckets = sum(len(buckets) for _, buckets in self._shards)
+        return {"backend": "memory", "buckets": buckets, "rejected": dict(self.rejected)}
+
+
+class SQLiteRateLimiter:
+    """Token buckets in the rate_limits table, shared by every worker on database.db."""
+    blocking = True
+
+    def __init__(self):
+        self.rejected = Counter()  # rule name -> 429s sent (this worker only)
+
+    def consume(self, key: str, rate: float, burst: int) -> float:
+        now = time.time()
+        with database.connection() as conn:
+            database.begin_immediate(conn)
+            try:
+                row = conn.execute("SELECT tokens, updated FROM rate_limits WHERE key=?", (key,)).fetchone()
+                tokens = burst if row is None else min(burst, row["tokens"] + (now - row["updated"]) * rate)
+                allowed = tokens >= 1
+                conn.execute(
+                    "INSERT INTO rate_limits (key, tokens, updated) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET tokens=excluded.tokens, updated=excluded.updated",
+                    (key, tokens - 1 if allowed else tokens, now)
+                )
+                if row is None:
+                    # New client: also the moment to drop buckets idle long enough to be full again
+                    conn.execute("DELETE FROM rate_limits WHERE updated < ?", (now - IDLE_BUCKET_SECONDS,))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return 0.0 if allowed else (1 - tokens) / rate
+
+    def stats(self) -> dict:
+        with database.connection() as conn:
+            buckets = conn.execute("SELECT COUNT(*) FROM rate_limits").fetchone()[0]
+        return {"backend": "sqlite", "buckets": buckets, "rejected": dict(self.rejected)}
+
+
+def create_limiter(backend: str = RATE_LIMIT_BACKEND):
+    if backend == "sqlite":
+        return SQLiteRateLimiter()
+    if backend == "memory":
+        return MemoryRateLimiter()
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND {backend!r}")
+
+
+default_limiter = create_limiter()
+
+
+def _client_ip(scope) -> str:
+    # Behind a proxy, run uvicorn with --proxy-headers so this is the real client
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def _bearer_subject(scope) -> Optional[str]:
+    from auth import utils  # Imported late: auth.utils pulls in the whole auth stack
+    return utils.bearer_subject(scope)
+
+
+class RateLimitMiddleware:
+    """Pure ASGI: rejected requests never reach routing, and allowed ones pay one bucket update."""
+
+    def __init__(self, app, rules: List[RateLimitRule], limiter=None, enabled: bool = RATE_LIMIT_ENABLED):
+        self.app = app
+        self.rules = rules
+        self.limiter = limiter or default_limiter
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        method, path = scope["method"], scope["path"]
+        for rule in self.rules:
+            if not rule.matches(method, path):
+                continue
+            subject = _bearer_subject(scope) if rule.key == "user" else None
+            key = f"{rule.name}:user:{subject}" if subject else f"{rule.name}:ip:{_client_ip(scope)}"
+
+            if self.limiter.blocking:
+                retry_after = await run_in_threadpool(self.limiter.consume, key, rule.rate, rule.burst)
+            else:
+                retry_after = self.limiter.consume(key, rule.rate, rule.burst)
+            if retry_after > 0:
+                self.limiter.rejected[rule.name] += 1
+                metrics.resolve_route_template(scope)
+                await self._reject(send, retry_after)
+                return
+            break  # First match wins: /accounts/bulk must not also spend an /accounts token
+
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    async def _reject(send, retry_after: float) -> None:
+        body = json.dumps({"detail": "Too many requests"}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode("latin-1")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
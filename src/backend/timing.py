@@ -0,0 +1,84 @@
+"""
+Per-request phase timings, sent back as a Server-Timing header and written to the access log.
+
+ObservabilityMiddleware puts a RequestTimings in logging_config.request_timings_ctx; code on the
+request path records into it with `with timing.phase("insert"):`. Outside a request (CLI tools,
+background tasks) phase() only costs the context variable lookup. A phase entered several times
+in one request adds up. Phases are exclusive: a phase nested in another (write_lock inside
+idem_read) is not counted in the outer one, so the phases never add up to more than the request.
+The browser's devtools (Network > Timing) and load tests read the header.
+"""
+import time
+from contextlib import contextmanager
+
+from logging_config import request_timings_ctx
+
+# Shown as the desc of each Server-Timing entry
+DESCRIPTIONS = {
+    "jwt": "Token verification",
+    "revocation": "Token revocation check",
+    "principal": "User lookup",
+    "validation": "Request parsing, validation and dependencies",
+    "idem_read": "Idempotency lookup",
+    "id_alloc": "Account ID allocation",
+    "write_lock": "Waiting for the write lock",
+    "insert": "Account insert",
+    "idem_write": "Idempotency save",
+    "commit": "Commit",
+}
+
+
+class RequestTimings:
+    """Seconds per phase for one request. Its threads record one at a time, so no lock."""
+    __slots__ = ("phases", "recorded", "open", "handler_mark")
+
+    def __init__(self):
+        self.phases = {}
+        self.recorded = 0.0  # Sum of all phases so far
+        self.open = []  # Per open phase, innermost last: seconds spent in its nested phases
+        self.handler_mark = None  # (perf_counter, recorded) when the route handler started, see routing.TimedRoute
+
+    def add(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+        self.recorded += seconds
+
+    def as_dict(self) -> dict:
+        """Milliseconds per phase, for the JSON access log."""
+        return {name: round(seconds * 1000, 3) for name, seconds in self.phases.items()}
+
+    def header(self, total: float, queries=None) -> str:
+        """The Server-Timing value: every phase, all SQL statements (db) and the total, in ms."""
+        entries = [
+            f'{name};dur={seconds * 1000:.3f};desc="{DESCRIPTIONS.get(name, name)}"'
+            for name, seconds in self.phases.items()
+        ]
+        if queries is not None and queries.count:
+            plural = "s" if queries.count != 1 else ""
+            entries.append(f'db;dur={queries.seconds * 1000:.3f};desc="{queries.count} SQL statement{plural}"')
+        entries.append(f"total;dur={total * 1000:.3f}")
+        return ", ".join(entries)
+
+    def __str__(self):
+        # Appended to the text access log line
+        if not self.phases:
+            return ""
+        return " [" + " ".join(f"{name}={seconds * 1000:.2f}" for name, seconds in self.phases.items()) + "]"
+
+
+@contextmanager
+def phase(name: str):
+    """Times the block into the current request's timings (no-op outside a request)."""
+    timings = request_timings_ctx.get()
+    if timings is None:
+        yield
+        return
+    timings.open.append(0.0)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        timings.add(name, elapsed - timings.open.pop())
+        if timings.open:
+            timings.open[-1] += elapsed
+
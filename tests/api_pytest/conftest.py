@@ -1,12 +1,15 @@
 import os
+import uuid
 import pytest
 import requests
 from tests.api_pytest.services.accounts_api import AccountsAPI
+from tests.api_pytest.utils.csv_reader import read_csv
 from dotenv import load_dotenv
 
 load_dotenv()
 
 BASE_URL = os.getenv("BASE_URL")
+ACCOUNTS_DATA_FILE = os.path.join(os.path.dirname(__file__), "data", "accounts.csv")
 
 
 @pytest.fixture(scope="session")
@@ -83,4 +86,27 @@ def accounts_api_manager(base_url, manager_token):
     """
     Returns AccountsAPI initialized with the Manager's token.
     """
-    return AccountsAPI(base_url, token=manager_token)
\ No newline at end of file
+    return AccountsAPI(base_url, token=manager_token)
+
+
+# =========================================================
+# Data Fixtures
+# =========================================================
+
+@pytest.fixture(scope="session")
+def seeded_zip_code(accounts_api_manager):
+    """
+    Creates the first three CSV accounts under a zip code unique to this run,
+    so the filter isolates them from whatever else is in the database.
+    """
+    zip_code = uuid.uuid4().hex[:10]
+    account_ids = []
+    for row in read_csv(ACCOUNTS_DATA_FILE)[:3]:
+        response = accounts_api_manager.create_account({**row, "zip_code": zip_code})
+        assert response.status_code == 200
+        account_ids.append(response.json()["account_id"])
+
+    yield zip_code, sorted(account_ids)
+
+    for account_id in account_ids:
+        accounts_api_manager.delete_account(account_id)
\ No newline at end of file
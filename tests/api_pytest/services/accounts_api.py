@@ -7,17 +7,9 @@ class AccountsAPI(BaseAPI):
         self.base_url = base_url
         self.token = token
 
-    def create_account(self, row):
-        url = f'{self.base_url}/accounts'
-        headers = {
-            "content-type": "application/json",
-            "accept": "application/json",
-            "Authorization": f"Bearer {self.token}",
-            "Idempotency-Id": str(uuid.uuid4()),
-            "X-Process-Id": str(uuid.uuid4())
-        }
-
-        create_payload = {
+    @staticmethod
+    def build_create_payload(row):
+        return {
             "account_holder_name": row["account_holder_name"],
             "dob": row["dob"],
             "gender": row["gender"],
@@ -32,9 +24,68 @@ class AccountsAPI(BaseAPI):
             "marketing_opt_in": row["marketing_opt_in"].lower() == "true",
             "agreed_to_terms": True
         }
+
+    def create_account(self, row, idempotency_id=None):
+        url = f'{self.base_url}/accounts'
+        headers = {
+            "content-type": "application/json",
+            "accept": "application/json",
+            "Authorization": f"Bearer {self.token}",
+            "Idempotency-Id": idempotency_id or str(uuid.uuid4()),
+            "X-Process-Id": str(uuid.uuid4())
+        }
+
+        create_payload = self.build_create_payload(row)
         return self.post(url, headers, create_payload)
 
-    def get_account(self, account_id):
+    def create_accounts_bulk(self, rows, idempotency_id=None, item_keys=None):
+        url = f'{self.base_url}/accounts/bulk'
+        headers = {
+            "content-type": "application/json",
+            "accept": "application/json",
+            "Authorization": f"Bearer {self.token}",
+            "Idempotency-Id": idempotency_id or str(uuid.uuid4()),
+            "X-Process-Id": str(uuid.uuid4())
+        }
+
+        bulk_payload = [self.build_create_payload(row) for row in rows]
+        for payload, key in zip(bulk_payload, item_keys or []):
+            if key:
+                payload["idempotency_id"] = key
+        return self.post(url, headers, bulk_payload)
+
+    def import_accounts(self, file_name, content, **params):
+        url = f'{self.base_url}/accounts/import'
+        headers = {
+            "accept": "application/json",
+            "Authorization": f"Bearer {self.token}",
+            "X-Process-Id": str(uuid.uuid4())
+        }
+
+        return self.upload(url, headers, files={"file": (file_name, content)}, params=params)
+
+    def list_accounts(self, if_none_match=None, **params):
+        url = f'{self.base_url}/accounts'
+        headers = {
+            "accept": "application/json",
+            "Authorization": f"Bearer {self.token}",
+            "X-Process-Id": str(uuid.uuid4())
+        }
+        if if_none_match:
+            headers["If-None-Match"] = if_none_match
+
+        return self.get(url, headers, params=params)
+
+    def export_accounts(self, **params):
+        url = f'{self.base_url}/accounts/export'
+        headers = {
+            "Authorization": f"Bearer {self.token}",
+            "X-Process-Id": str(uuid.uuid4())
+        }
+
+        return self.get(url, headers, params=params)
+
+    def get_account(self, account_id, if_none_match=None):
         url = f'{self.base_url}/accounts/{account_id}'
         headers = {
             "content-type": "application/json",
@@ -42,10 +93,12 @@ class AccountsAPI(BaseAPI):
             "Authorization": f"Bearer {self.token}",
             "X-Process-Id": str(uuid.uuid4())
         }
+        if if_none_match:
+            headers["If-None-Match"] = if_none_match
 
         return self.get(url, headers)
 
-    def update_account(self, row, account_id):
+    def update_account(self, row, account_id, if_match=None, idempotency_id=None):
         url = f'{self.base_url}/accounts/{account_id}'
         headers = {
             "content-type": "application/json",
@@ -53,6 +106,10 @@ class AccountsAPI(BaseAPI):
             "Authorization": f"Bearer {self.token}",
             "X-Process-Id": str(uuid.uuid4())
         }
+        if if_match:
+            headers["If-Match"] = if_match
+        if idempotency_id:
+            headers["Idempotency-Id"] = idempotency_id
 
         update_payload = {
             "account_holder_name": row["updated_account_holder_name"],
@@ -72,7 +129,7 @@ class AccountsAPI(BaseAPI):
 
         return self.put(url, headers, update_payload)
 
-    def delete_account(self, account_id):
+    def delete_account(self, account_id, idempotency_id=None):
         url = f'{self.base_url}/accounts/{account_id}'
         headers = {
             "content-type": "application/json",
@@ -80,4 +137,6 @@ class AccountsAPI(BaseAPI):
             "Authorization": f"Bearer {self.token}",
             "X-Process-Id": str(uuid.uuid4())
         }
+        if idempotency_id:
+            headers["Idempotency-Id"] = idempotency_id
         return self.delete(url, headers)
@@ -0,0 +1,27 @@
+import requests
+from tests.api_pytest.utils.allure_logger import allure_attach
+
+class AuthAPI:
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+    def login(self, username, password):
+        url = f'{self.base_url}/token'
+        # OAuth2 spec requires form-data
+        response = requests.post(url, data={"username": username, "password": password})
+        allure_attach("POST", url, response, payload={"username": username})
+        return response
+
+    def refresh(self, refresh_token):
+        url = f'{self.base_url}/refresh'
+        response = requests.post(url, cookies={"refresh_token": refresh_token})
+        allure_attach("POST", url, response, headers={"Cookie": "refresh_token=..."})
+        return response
+
+    def logout(self, access_token, refresh_token):
+        url = f'{self.base_url}/logout'
+        headers = {"Authorization": f"Bearer {access_token}"}
+        response = requests.post(url, headers=headers, cookies={"refresh_token": refresh_token})
+        allure_attach("POST", url, response, headers=headers)
+        return response
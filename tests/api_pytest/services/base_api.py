@@ -8,9 +8,14 @@ class BaseAPI:
         allure_attach("POST", url, response, headers=headers, payload=payload)
         return response
 
-    def get(self, url, headers):
-        response = requests.get(url, headers=headers)
-        allure_attach("GET", url, response, headers=headers)
+    def upload(self, url, headers, files, params=None):
+        response = requests.post(url, headers=headers, files=files, params=params)
+        allure_attach("POST", url, response, headers=headers, payload={"files": list(files), "params": params})
+        return response
+
+    def get(self, url, headers, params=None):
+        response = requests.get(url, headers=headers, params=params)
+        allure_attach("GET", url, response, headers=headers, payload=params)
         return response
 
     def put(self, url, headers, payload):
@@ -0,0 +1,77 @@
+import os
+import uuid
+
+import pytest
+import allure
+
+from tests.api_pytest.utils.csv_reader import read_csv
+from tests.api_pytest.utils.expected_response import ExpectedResponse
+from tests.api_pytest.utils.allure_logger import assert_json_match
+
+TEST_DATA_FILE = os.path.join(os.path.dirname(__file__), "data", "accounts.csv")
+
+
+# Behavior-based Hierarchy
+@allure.epic("Bank Management System")
+@allure.feature("API Testing - Pytest")
+@allure.story("Bulk Create")
+
+# Suite-based Hierarchy
+@allure.parent_suite("Bank Management System")
+@allure.suite("API Testing - Pytest")
+@allure.sub_suite("Bulk Create")
+
+@pytest.mark.regression
+def test_bulk_create_with_idempotency(accounts_api_manager):
+    rows = read_csv(TEST_DATA_FILE)
+    batch_key = str(uuid.uuid4())
+    item_key = str(uuid.uuid4())
+
+    with allure.step("Create a batch (POST /accounts/bulk)"):
+        response = accounts_api_manager.create_accounts_bulk(rows, idempotency_id=batch_key, item_keys=[item_key])
+        assert response.status_code == 200
+
+        body = response.json()
+        assert body["created"] == len(rows)
+        assert body["replayed"] == 0
+        assert [r["index"] for r in body["results"]] == list(range(len(rows)))
+        assert len({r["account_id"] for r in body["results"]}) == len(rows)
+
+    with allure.step("Every created account is readable (GET)"):
+        for row, result in zip(rows, body["results"]):
+            get_response = accounts_api_manager.get_account(result["account_id"])
+            assert get_response.status_code == 200
+            expected_response = ExpectedResponse.expected_response_get_account_create(row, result["account_id"])
+            assert_json_match(get_response.json(), expected_response)
+
+    with allure.step("Retrying the batch replays the stored response"):
+        retry = accounts_api_manager.create_accounts_bulk(rows, idempotency_id=batch_key, item_keys=[item_key])
+        assert retry.status_code == 200
+        assert retry.json() == body
+
+    with allure.step("A new batch reusing an item key replays that item only"):
+        second = accounts_api_manager.create_accounts_bulk(rows[:2], item_keys=[item_key])
+        assert second.status_code == 200
+
+        second_body = second.json()
+        assert second_body["created"] == 1
+        assert second_body["replayed"] == 1
+        assert second_body["results"][0]["replayed"] is True
+        assert second_body["results"][0]["account_id"] == body["results"][0]["account_id"]
+
+    with allure.step("Clean up (DELETE)"):
+        for result in body["results"] + second_body["results"][1:]:
+            accounts_api_manager.delete_account(result["account_id"])
+
+
+@allure.epic("Bank Management System")
+@allure.feature("API Testing - Pytest")
+@allure.story("Bulk Create")
+@allure.parent_suite("Bank Management System")
+@allure.suite("API Testing - Pytest")
+@allure.sub_suite("Bulk Create")
+
+@pytest.mark.regression
+def test_bulk_create_rejects_empty_batch(accounts_api_manager):
+    response = accounts_api_manager.create_accounts_bulk([])
+    assert response.status_code == 422
@@ -0,0 +1,101 @@
+import os
+
+import pytest
+import allure
+
+from tests.api_pytest.utils.csv_reader import read_csv
+
+TEST_DATA_FILE = os.path.join(os.path.dirname(__file__), "data", "accounts.csv")
+
+
+@pytest.fixture
+def created_account(accounts_api_manager):
+    """Creates an account from the first CSV row; deleted after the test. Yields (row, account_id)."""
+    row = read_csv(TEST_DATA_FILE)[0]
+    create_response = accounts_api_manager.create_account(row)
+    assert create_response.status_code == 200
+    account_id = create_response.json()["account_id"]
+
+    yield row, account_id
+
+    accounts_api_manager.delete_account(account_id)
+
+
+# Behavior-based Hierarchy
+@allure.epic("Bank Management System")
+@allure.feature("API Testing - Pytest")
+@allure.story("Conditional Requests")
+
+# Suite-based Hierarchy
+@allure.parent_suite("Bank Management System")
+@allure.suite("API Testing - Pytest")
+@allure.sub_suite("Conditional Requests")
+
+@pytest.mark.regression
+def test_account_etag_and_if_match(accounts_api_manager, created_account):
+    row, account_id = created_account
+
+    with allure.step("GET returns an ETag; If-None-Match with it gets 304"):
+        get_response = accounts_api_manager.get_account(account_id)
+        assert get_response.status_code == 200
+        etag = get_response.headers["ETag"]
+
+        not_modified = accounts_api_manager.get_account(account_id, if_none_match=etag)
+        assert not_modified.status_code == 304
+        assert not_modified.content == b""
+        assert not_modified.headers["ETag"] == etag
+
+    with allure.step("PUT with the current ETag succeeds and changes it"):
+        put_response = accounts_api_manager.update_account(row, account_id, if_match=etag)
+        assert put_response.status_code == 200
+        new_etag = put_response.headers["ETag"]
+        assert new_etag != etag
+
+        get_response = accounts_api_manager.get_account(account_id, if_none_match=etag)
+        assert get_response.status_code == 200
+        assert get_response.headers["ETag"] == new_etag
+        assert get_response.json()["account_holder_name"] == row["updated_account_holder_name"]
+
+    with allure.step("PUT with a stale ETag is rejected (412)"):
+        stale_response = accounts_api_manager.update_account(row, account_id, if_match=etag)
+        assert stale_response.status_code == 412
+
+
+# Behavior-based Hierarchy
+@allure.epic("Bank Management System")
+@allure.feature("API Testing - Pytest")
+@allure.story("Conditional Requests")
+
+# Suite-based Hierarchy
+@allure.parent_suite("Bank Management System")
+@allure.suite("API Testing - Pytest")
+@allure.sub_suite("Conditional Requests")
+
+@pytest.mark.regression
+def test_account_list_etag(accounts_api_manager, seeded_zip_code):
+    zip_code, _ = seeded_zip_code
+
+    with allure.step("An unchanged page is answered with 304"):
+        first = accounts_api_manager.list_accounts(zip_code=zip_code)
+        assert first.status_code == 200
+        etag = first.headers["ETag"]
+
+        again = accounts_api_manager.list_accounts(if_none_match=etag, zip_code=zip_code)
+        assert again.status_code == 304
+
+    with allure.step("Another query has its own ETag"):
+        other = accounts_api_manager.list_accounts(if_none_match=etag, zip_code=zip_code, limit=1)
+        assert other.status_code == 200
+        assert other.headers["ETag"] != etag
+
+    with allure.step("A write to accounts changes the ETag"):
+        row = read_csv(TEST_DATA_FILE)[0]
+        create_response = accounts_api_manager.create_account(row)
+        assert create_response.status_code == 200
+
+        after_write = accounts_api_manager.list_accounts(if_none_match=etag, zip_code=zip_code)
+        assert after_write.status_code == 200
+        assert after_write.headers["ETag"] != etag
+
+    with allure.step("Clean up (DELETE)"):
+        accounts_api_manager.delete_account(create_response.json()["account_id"])
@@ -0,0 +1,61 @@
+import csv
+import io
+import json
+
+import pytest
+import allure
+
+EXPECTED_CSV_HEADER = [
+    "account_id", "account_holder_name", "dob", "gender", "email", "phone",
+    "address", "zip_code", "account_type", "balance", "date_opened",
+    "status", "services", "marketing_opt_in", "agreed_to_terms"
+]
+
+
+# Behavior-based Hierarchy
+@allure.epic("Bank Management System")
+@allure.feature("API Testing - Pytest")
+@allure.story("Export")
+
+# Suite-based Hierarchy
+@allure.parent_suite("Bank Management System")
+@allure.suite("API Testing - Pytest")
+@allure.sub_suite("Export")
+
+@pytest.mark.regression
+@pytest.mark.parametrize("gzip", [False, True], ids=["plain", "gzip"])
+def test_export_ndjson(accounts_api_clerk, seeded_zip_code, gzip):
+    zip_code, account_ids = seeded_zip_code
+
+    response = accounts_api_clerk.export_accounts(format="ndjson", zip_code=zip_code, gzip=gzip)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    if gzip:
+        assert response.headers["content-encoding"] == "gzip"
+
+    # requests transparently decodes Content-Encoding: gzip
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert [r["account_id"] for r in records] == account_ids
+    assert all(r["zip_code"] == zip_code for r in records)
+    assert all(r["agreed_to_terms"] is True for r in records)
+
+
+@allure.epic("Bank Management System")
+@allure.feature("API Testing - Pytest")
+@allure.story("Export")
+@allure.parent_suite("Bank Management System")
+@allure.suite("API Testing - Pytest")
+@allure.sub_suite("Export")
+
+@pytest.mark.regression
+def test_export_csv(accounts_api_clerk, seeded_zip_code):
+    zip_code, account_ids = seeded_zip_code
+
+    response = accounts_api_clerk.export_accounts(format="csv", zip_code=zip_code)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0] == EXPECTED_CSV_HEADER
+    assert [r[0] for r in rows[1:]] == account_ids
+    assert {r[-1] for r in rows[1:]} == {"true"}
@@ -0,0 +1,82 @@
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import allure
+
+from tests.api_pytest.utils.csv_reader import read_csv
+
+TEST_DATA_FILE = os.path.join(os.path.dirname(__file__), "data", "accounts.csv")
+
+
+# Behavior-based Hierarchy
+@allure.epic("Bank Management System")
+@allure.feature("API Testing - Pytest")
+@allure.story("Idempotency")
+
+# Suite-based Hierarchy
+@allure.parent_suite("Bank Management System")
+@allure.suite("API Testing - Pytest")
+@allure.sub_suite("Idempotency")
+
+@pytest.mark.regression
+def test_concurrent_retries_create_one_account(accounts_api_manager):
+    row = read_csv(TEST_DATA_FILE)[0]
+    idempotency_id = str(uuid.uuid4())
+
+    with allure.step("Send the same create (POST) 10 times at once"):
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            responses = list(executor.map(
+                lambda _: accounts_api_manager.create_account(row, idempotency_id=idempotency_id), range(10)
+            ))
+
+    with allure.step("Every attempt gets the response of the single account created"):
+        assert {response.status_code for response in responses} == {200}
+        assert len({response.json()["account_id"] for response in responses}) == 1
+
+    with allure.step("A later retry replays it too"):
+        retry = accounts_api_manager.create_account(row, idempotency_id=idempotency_id)
+        assert retry.status_code == 200
+        assert retry.json() == responses[0].json()
+
+    with allure.step("Clean up (DELETE)"):
+        assert accounts_api_manager.delete_account(responses[0].json()["account_id"]).status_code == 200
+
+
+# Behavior-based Hierarchy
+@allure.epic("Bank Management System")
+@allure.feature("API Testing - Pytest")
+@allure.story("Idempotency")
+
+# Suite-based Hierarchy
+@allure.parent_suite("Bank Management System")
+@allure.suite("API Testing - Pytest")
+@allure.sub_suite("Idempotency")
+
+@pytest.mark.regression
+def test_retried_update_and_delete_are_replayed(accounts_api_manager):
+    row = read_csv(TEST_DATA_FILE)[0]
+    account_id = accounts_api_manager.create_account(row).json()["account_id"]
+
+    with allure.step("Update (PUT) with an Idempotency-Id, then retry it"):
+        update_key = str(uuid.uuid4())
+        first = accounts_api_manager.update_account(row, account_id, idempotency_id=update_key)
+        retry = accounts_api_manager.update_account(row, account_id, idempotency_id=update_key)
+        assert first.status_code == retry.status_code == 200
+        assert retry.json() == first.json()
+        assert retry.headers["ETag"] == first.headers["ETag"]
+        assert retry.headers.get("Idempotent-Replayed") == "true"
+        assert accounts_api_manager.get_account(account_id).headers["ETag"] == first.headers["ETag"]
+
+    with allure.step("The same key with a different body is rejected"):
+        changed = {**row, "updated_email": "changed." + row["updated_email"]}
+        reused = accounts_api_manager.update_account(changed, account_id, idempotency_id=update_key)
+        assert reused.status_code == 422
+
+    with allure.step("Delete with an Idempotency-Id, then retry it"):
+        delete_key = str(uuid.uuid4())
+        first = accounts_api_manager.delete_account(account_id, idempotency_id=delete_key)
+        retry = accounts_api_manager.delete_account(account_id, idempotency_id=delete_key)
+        assert first.status_code == retry.status_code == 200
+        assert retry.json() == first.json()
@@ -0,0 +1,74 @@
+import csv
+import io
+import os
+import uuid
+
+import pytest
+import allure
+
+TEST_DATA_FILE = os.path.join(os.path.dirname(__file__), "data", "accounts.csv")
+
+
+def build_import_file(zip_code):
+    """accounts.csv as-is (extra columns included), under one zip code, with line 3 made invalid."""
+    with open(TEST_DATA_FILE, newline="") as f:
+        rows = list(csv.DictReader(f))
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(rows[0].keys()))
+    writer.writeheader()
+    for row in rows:
+        writer.writerow({**row, "zip_code": zip_code})
+    content = buffer.getvalue().splitlines()
+    content[2] = content[2].replace("@example.com", "")  # Second data row: invalid email
+    return "\n".join(content) + "\n", len(rows)
+
+
+# Behavior-based Hierarchy
+@allure.epic("Bank Management System")
+@allure.feature("API Testing - Pytest")
+@allure.story("Import")
+
+# Suite-based Hierarchy
+@allure.parent_suite("Bank Management System")
+@allure.suite("API Testing - Pytest")
+@allure.sub_suite("Import")
+
+@pytest.mark.regression
+def test_import_csv_reports_rejects(accounts_api_manager):
+    zip_code = uuid.uuid4().hex[:10]
+    content, row_count = build_import_file(zip_code)
+
+    with allure.step("Upload CSV (POST /accounts/import)"):
+        response = accounts_api_manager.import_accounts("accounts.csv", content)
+        assert response.status_code == 200
+
+        report = response.json()
+        assert report["processed"] == row_count
+        assert report["imported"] == row_count - 1
+        assert report["rejected"] == 1
+        assert report["rejects"] == [{"line": 3, "errors": {"email": "invalid email"}}]
+        assert report["rejects_truncated"] is False
+
+    with allure.step("Imported accounts are listed (GET)"):
+        listed = accounts_api_manager.list_accounts(zip_code=zip_code, limit=100)
+        items = listed.json()["items"]
+        assert len(items) == row_count - 1
+
+    with allure.step("Clean up (DELETE)"):
+        for item in items:
+            accounts_api_manager.delete_account(item["account_id"])
+
+
+@allure.epic("Bank Management System")
+@allure.feature("API Testing - Pytest")
+@allure.story("Import")
+@allure.parent_suite("Bank Management System")
+@allure.suite("API Testing - Pytest")
+@allure.sub_suite("Import")
+
+@pytest.mark.regression
+def test_import_rejects_missing_columns(accounts_api_manager):
+    response = accounts_api_manager.import_accounts("accounts.csv", "account_holder_name,dob\nJohn,1990-01-01\n")
+    assert response.status_code == 400
+    assert "Missing required columns" in response.json()["detail"]
@@ -0,0 +1,71 @@
+import base64
+import json
+
+import pytest
+import allure
+
+
+# Behavior-based Hierarchy
+@allure.epic("Bank Management System")
+@allure.feature("API Testing - Pytest")
+@allure.story("Pagination")
+
+# Suite-based Hierarchy
+@allure.parent_suite("Bank Management System")
+@allure.suite("API Testing - Pytest")
+@allure.sub_suite("Pagination")
+
+@pytest.mark.regression
+def test_accounts_keyset_pagination(accounts_api_clerk, seeded_zip_code):
+    zip_code, account_ids = seeded_zip_code
+
+    with allure.step("First page (limit=2)"):
+        first = accounts_api_clerk.list_accounts(zip_code=zip_code, limit=2)
+        assert first.status_code == 200
+        body = first.json()
+        assert [a["account_id"] for a in body["items"]] == account_ids[:2]
+        assert body["next_cursor"]
+
+    with allure.step("Second page via next_cursor"):
+        second = accounts_api_clerk.list_accounts(zip_code=zip_code, limit=2, cursor=body["next_cursor"])
+        assert second.status_code == 200
+        body = second.json()
+        assert [a["account_id"] for a in body["items"]] == account_ids[2:]
+        assert body["next_cursor"] is None
+
+
+@allure.epic("Bank Management System")
+@allure.feature("API Testing - Pytest")
+@allure.story("Pagination")
+@allure.parent_suite("Bank Management System")
+@allure.suite("API Testing - Pytest")
+@allure.sub_suite("Pagination")
+
+@pytest.mark.regression
+def test_accounts_sorted_by_balance_desc(accounts_api_clerk, seeded_zip_code):
+    zip_code, account_ids = seeded_zip_code
+
+    response = accounts_api_clerk.list_accounts(zip_code=zip_code, sort_by="balance", order="desc")
+    assert response.status_code == 200
+
+    balances = [a["balance"] for a in response.json()["items"]]
+    assert len(balances) == len(account_ids)
+    assert balances == sorted(balances, reverse=True)
+
+
+@allure.epic("Bank Management System")
+@allure.feature("API Testing - Pytest")
+@allure.story("Pagination")
+@allure.parent_suite("Bank Management System")
+@allure.suite("API Testing - Pytest")
+@allure.sub_suite("Pagination")
+
+@pytest.mark.regression
+@pytest.mark.parametrize("cursor", [
+    "not-a-cursor",
+    # Well-formed, but the sort value is an object
+    base64.urlsafe_b64encode(json.dumps([{"a": 1}, "x"]).encode()).decode().rstrip("="),
+])
+def test_accounts_invalid_cursor(accounts_api_clerk, cursor):
+    response = accounts_api_clerk.list_accounts(cursor=cursor, sort_by="balance")
+    assert response.status_code == 400
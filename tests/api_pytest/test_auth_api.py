@@ -0,0 +1,117 @@
+import os
+import time
+
+import pytest
+import allure
+
+from tests.api_pytest.services.accounts_api import AccountsAPI
+from tests.api_pytest.services.auth_api import AuthAPI
+
+# Must match the server's settings; reuse is only detected once the grace window has passed
+REUSE_GRACE_SECONDS = float(os.getenv("REFRESH_REUSE_GRACE_SECONDS", "30"))
+# With several workers, the others learn about a revocation at their next sync
+REVOCATION_SYNC_SECONDS = float(os.getenv("REVOCATION_SYNC_SECONDS", "5"))
+
+
+@pytest.fixture
+def auth_api(base_url):
+    return AuthAPI(base_url)
+
+
+@pytest.fixture
+def clerk_session(auth_api):
+    """A fresh login as Clerk: (access token, refresh token)."""
+    response = auth_api.login(os.getenv("CLERK_USERNAME"), os.getenv("CLERK_PASSWORD"))
+    assert response.status_code == 200
+    return response.json()["access_token"], response.cookies["refresh_token"]
+
+
+def access_token_works(base_url, access_token):
+    return AccountsAPI(base_url, token=access_token).list_accounts(limit=1).status_code == 200
+
+
+def access_token_revoked(base_url, access_token):
+    deadline = time.monotonic() + REVOCATION_SYNC_SECONDS + 1
+    while access_token_works(base_url, access_token):
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.5)
+    return True
+
+
+# Behavior-based Hierarchy
+@allure.epic("Bank Management System")
+@allure.feature("API Testing - Pytest")
+@allure.story("Authentication")
+
+# Suite-based Hierarchy
+@allure.parent_suite("Bank Management System")
+@allure.suite("API Testing - Pytest")
+@allure.sub_suite("Authentication")
+
+@pytest.mark.regression
+def test_refresh_rotates_tokens(auth_api, clerk_session, base_url):
+    _, refresh_token = clerk_session
+
+    with allure.step("Refresh returns a new access token and a new refresh cookie"):
+        response = auth_api.refresh(refresh_token)
+        assert response.status_code == 200
+        new_refresh_token = response.cookies["refresh_token"]
+        assert new_refresh_token != refresh_token
+        assert access_token_works(base_url, response.json()["access_token"])
+
+    with allure.step("The new refresh token can be refreshed in turn"):
+        assert auth_api.refresh(new_refresh_token).status_code == 200
+
+
+# Behavior-based Hierarchy
+@allure.epic("Bank Management System")
+@allure.feature("API Testing - Pytest")
+@allure.story("Authentication")
+
+# Suite-based Hierarchy
+@allure.parent_suite("Bank Management System")
+@allure.suite("API Testing - Pytest")
+@allure.sub_suite("Authentication")
+
+@pytest.mark.regression
+@pytest.mark.skipif(REUSE_GRACE_SECONDS > 5, reason="run the server with REFRESH_REUSE_GRACE_SECONDS <= 5")
+def test_refresh_token_reuse_revokes_family(auth_api, clerk_session, base_url):
+    _, refresh_token = clerk_session
+
+    with allure.step("Rotate the refresh token"):
+        response = auth_api.refresh(refresh_token)
+        assert response.status_code == 200
+        new_access_token = response.json()["access_token"]
+        new_refresh_token = response.cookies["refresh_token"]
+
+    with allure.step("Presenting the rotated token again, after the grace window, is rejected"):
+        time.sleep(REUSE_GRACE_SECONDS + 0.5)
+        assert auth_api.refresh(refresh_token).status_code == 401
+
+    with allure.step("The whole family is revoked: the newer tokens stop working too"):
+        assert auth_api.refresh(new_refresh_token).status_code == 401
+        assert access_token_revoked(base_url, new_access_token)
+
+
+# Behavior-based Hierarchy
+@allure.epic("Bank Management System")
+@allure.feature("API Testing - Pytest")
+@allure.story("Authentication")
+
+# Suite-based Hierarchy
+@allure.parent_suite("Bank Management System")
+@allure.suite("API Testing - Pytest")
+@allure.sub_suite("Authentication")
+
+@pytest.mark.regression
+def test_logout_revokes_refresh_and_access_tokens(auth_api, clerk_session, base_url):
+    access_token, refresh_token = clerk_session
+    assert access_token_works(base_url, access_token)
+
+    with allure.step("Logout"):
+        assert auth_api.logout(access_token, refresh_token).status_code == 200
+
+    with allure.step("Neither the refresh token nor the access token work anymore"):
+        assert auth_api.refresh(refresh_token).status_code == 401
+        assert access_token_revoked(base_url, access_token)
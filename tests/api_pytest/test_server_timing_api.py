@@ -0,0 +1,49 @@
+import os
+import re
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import allure
+
+from tests.api_pytest.utils.csv_reader import read_csv
+
+TEST_DATA_FILE = os.path.join(os.path.dirname(__file__), "data", "accounts.csv")
+# name;dur=1.234 (descriptions can contain commas, so the header is not split on them)
+SERVER_TIMING_ENTRY = re.compile(r'(?:^|, )(\w+);dur=(-?[\d.]+)')
+
+
+def server_timings(response):
+    return [(name, float(duration)) for name, duration in SERVER_TIMING_ENTRY.findall(response.headers["Server-Timing"])]
+
+
+# Behavior-based Hierarchy
+@allure.epic("Bank Management System")
+@allure.feature("API Testing - Pytest")
+@allure.story("Server-Timing")
+
+# Suite-based Hierarchy
+@allure.parent_suite("Bank Management System")
+@allure.suite("API Testing - Pytest")
+@allure.sub_suite("Server-Timing")
+
+@pytest.mark.regression
+def test_create_account_timings_are_not_negative(accounts_api_manager):
+    row = read_csv(TEST_DATA_FILE)[0]
+
+    with allure.step("Create (POST) 10 accounts at once, with Idempotency-Ids, so they wait for the write lock"):
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            responses = list(executor.map(
+                lambda _: accounts_api_manager.create_account(row, idempotency_id=str(uuid.uuid4())), range(10)
+            ))
+        assert {response.status_code for response in responses} == {200}
+
+    with allure.step("Every Server-Timing duration is >= 0"):
+        for response in responses:
+            timings = server_timings(response)
+            assert {"validation", "insert", "commit", "total"} <= {name for name, _ in timings}
+            assert all(duration >= 0 for _, duration in timings), response.headers["Server-Timing"]
+
+    with allure.step("Clean up (DELETE)"):
+        for response in responses:
+            assert accounts_api_manager.delete_account(response.json()["account_id"]).status_code == 200